@@ -1,52 +1,47 @@
 #!/usr/bin/env python3
 #This python script is only suitable for UPS Shield X1200, X1201 and X1202
 
-import struct
 import smbus2
 import time
 from subprocess import call
+from gauge import FuelGauge
 
-def readVoltage(bus):
+def check(gauge): # one pass of the loop; True once the pack is below the shutdown voltage
 
-     address = 0x36
-     read = bus.read_word_data(address, 2)
-     swapped = struct.unpack("<H", struct.pack(">H", read))[0]
-     voltage = swapped * 1.25 /1000/16
-     return voltage
+ voltage, capacity = gauge.refresh() # one block read per loop
 
+ print ("******************")
+ print ("Voltage:%5.2fV" % voltage)
 
-def readCapacity(bus):
+ print ("Battery:%5i%%" % capacity)
 
-     address = 0x36
-     read = bus.read_word_data(address, 4)
-     swapped = struct.unpack("<H", struct.pack(">H", read))[0]
-     capacity = swapped/256
-     return capacity
+ if capacity == 100:
 
+         print ("Battery FULL")
 
-bus = smbus2.SMBus(1)
+ if capacity < 20:
 
-while True:
+         print ("Battery Low")
 
- print ("******************")
- print ("Voltage:%5.2fV" % readVoltage(bus))
+#Set battery low voltage to shut down
+ if voltage < 3.20:
 
- print ("Battery:%5i%%" % readCapacity(bus))
+         print ("Battery LOW!!!")
+         return True
 
- if readCapacity(bus) == 100:
+ return False
 
-         print ("Battery FULL")
+if __name__ == "__main__":
 
- if readCapacity(bus) < 20:
+ bus = smbus2.SMBus(1)
+ gauge = FuelGauge(bus)
 
-         print ("Battery Low")
+ while True:
 
-#Set battery low voltage to shut down
- if readVoltage(bus) < 3.20:
+  if check(gauge):
 
-         print ("Battery LOW!!!")
          print ("Shutdown in 5 seconds")
          time.sleep(5)
          call("sudo nohup shutdown -h now", shell=True)
 
- time.sleep(2)
+  time.sleep(2)
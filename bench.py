@@ -0,0 +1,943 @@
+#!/usr/bin/env python3
+# Hardware-free benchmark of one monitoring tick for each X120x front-end, on the fakes.py backends
+# reports per-tick latency, subprocess.Popen and Python open() calls, I2C transactions, allocations and CPU time
+# as JSON; the call counts come from audit hooks, so they are Python-level calls, not syscalls (os.pread, the
+# fork/exec inside Popen and anything C code opens are not seen)
+# usage: bench.py [ticks] [output.json]
+#        bench.py week [days] [output.json]: soaks over days of 1 Hz samples: GUI repaints, charge pin writes,
+#                                            journal bytes and fsyncs against line-by-line logging,
+#                                            gauge reads per outage with and without the chip alerts,
+#                                            watt-hours integrated against constant-load truth across restarts
+#        bench.py startup [runs] [script]: wall time and peak RSS of one-shot merged.py runs on AC
+#        bench.py estimator [trace.csv|history.bin ...]: runtime predictions from a growing history against the
+#                                                        time each discharge emptied (synthetic ones by default)
+#        bench.py blocking [seconds]: headless (offscreen Qt) event-loop stalls and terminal tick time while the
+#                                     fake sensors sleep past their deadline
+#        bench.py clients [n,n,...]: x120xd.py's serve() with n subscribers, I2C transactions per sample against n
+#        bench.py edges [count]: PLD edge latency, FakeLine.set_value() to PldWatcher.wait() returning
+#        bench.py http [n,n,...]: exporter.py's handler with n keep-alive HTTP clients, requests/s and latency
+#        bench.py scenarios: scripted outages replayed through the watchdog on a simulated clock, with the
+#                            detection latency and the wakeups per hour on AC and on battery
+#        bench.py shutdown [budget]: dummy pre-shutdown hooks run against a short budget, and the hook budget
+#                                    and margin to empty at the watchdog shutdown over simulated discharges
+
+import fakes
+HW = fakes.install(script=[(4.2 - i * 0.0005, 100 - i * 0.05) for i in range(2000)]) # before anything imports smbus2/gpiod
+
+import atexit
+import bisect
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+WARMUP = 3
+COUNTED = ("subprocess.Popen", "open") # audit events: Popen (vcgencmd) and open()/os.open calls
+MAX_PMIC_READS = 1 # vcgencmd pmic_read_adc runs per tick at most: every rail comes from one shared snapshot
+
+counts = dict.fromkeys(COUNTED + ("pmic_read_adc",), 0)
+
+def audit(event, args):
+    if event in counts:
+        counts[event] += 1
+        if event == "subprocess.Popen" and "pmic_read_adc" in str(args[1]):
+            counts["pmic_read_adc"] += 1
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN) # vcgencmd runs in children
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def measure(tick, ticks):
+    for _ in range(WARMUP):
+        tick()
+        HW.step()
+    events = dict(counts)
+    transactions = HW.bus.transactions
+    cpu = cpu_seconds()
+    latencies = []
+    pmic_reads = 0 # most in any one tick, an average would hide a tick that reads twice
+    for _ in range(ticks):
+        before = counts["pmic_read_adc"]
+        start = time.perf_counter_ns()
+        tick()
+        latencies.append((time.perf_counter_ns() - start) / 1000)
+        pmic_reads = max(pmic_reads, counts["pmic_read_adc"] - before)
+        HW.step()
+    assert pmic_reads <= MAX_PMIC_READS, f"{pmic_reads} vcgencmd pmic_read_adc calls in one tick"
+    cpu = cpu_seconds() - cpu
+    popens = counts["subprocess.Popen"] - events["subprocess.Popen"]
+    opens = counts["open"] - events["open"]
+    transactions = HW.bus.transactions - transactions
+
+    tracemalloc.start() # separate pass, tracing slows the ticks down
+    peaks = []
+    baseline = tracemalloc.get_traced_memory()[0]
+    for _ in range(min(ticks, 20)):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        tick()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        HW.step()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    return {
+        "latency_us": {
+            "mean": sum(latencies) / ticks,
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies),
+        },
+        "cpu_ms_per_tick": cpu * 1000 / ticks,
+        "popen_calls_per_tick": popens / ticks,
+        "pmic_reads_per_tick_max": pmic_reads,
+        "open_calls_per_tick": opens / ticks,
+        "i2c_transactions_per_tick": transactions / ticks,
+        "alloc_peak_bytes_per_tick": max(peaks),
+        "alloc_retained_bytes": retained,
+    }
+
+def bench_terminal():
+    from x120xd import Collector
+    from qtx120xTerminal import display_status
+    from policy import WarningPolicy
+    from journal import Journal
+    collector = Collector()
+    policy = WarningPolicy()
+    journal = Journal("bench")
+    def tick():
+        with contextlib.redirect_stdout(io.StringIO()):
+            display_status(collector.sample(), policy, journal)
+    return tick
+
+_qt = [] # the QApplication and windows live until exit, Qt aborts if a running QThread is destroyed
+
+def gui_window():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    import qtx120x
+    window = qtx120x.UPSStatusWindow()
+    _qt.extend((app, window))
+    atexit.register(window.close) # stops its sampling thread
+    window.show()
+    return app, window
+
+def bench_gui():
+    from x120xd import Collector
+    app, window = gui_window()
+    collector = Collector()
+    def tick():
+        window.update_status(collector.sample())
+        app.processEvents() # offscreen paint of whatever changed
+    return tick
+
+def bench_merged(): # one sample of merged.py's loop without the daemon: PLD, gauge, filter, scheduler, output
+    import merged
+    from journal import Journal
+    from pld import request_pld_line
+    watchdog = merged.Watchdog(Journal("bench"))
+    source = merged.HardwareSource(request_pld_line(), watchdog.scheduler)
+    def tick():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return watchdog.step(source.read())
+    return tick
+
+def bench_bat(): # one pass of bat.py's loop
+    import smbus2
+    import bat
+    from gauge import FuelGauge
+    gauge = FuelGauge(smbus2.SMBus(1))
+    def tick():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return bat.check(gauge)
+    return tick
+
+def split_parse_pmic_adc(output): # the per-line split parser sensors.py used before, as the baseline
+    rails = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        label, value = parts[0], parts[-1]
+        try:
+            rails[label] = float(value.split('=')[1][:-1])
+        except (IndexError, ValueError):
+            continue
+    return rails
+
+def bench_pmic_parse(): # one pmic_read_adc dump into a snapshot with per-rail watts
+    from sensors import PmicParser
+    output = fakes.pmic_read_adc_output()
+    parser = PmicParser()
+    assert parser.parse(output).rails == split_parse_pmic_adc(output)
+    def tick():
+        return parser.parse(output).watts
+    return tick
+
+def bench_pmic_parse_split():
+    from sensors import PmicSnapshot
+    output = fakes.pmic_read_adc_output()
+    def tick():
+        return PmicSnapshot(split_parse_pmic_adc(output)).watts
+    return tick
+
+def word_read_gauge(bus, address=0x36): # the two byte-swapped word reads the scripts used before gauge.py, as the baseline
+    import struct
+    read = bus.read_word_data(address, 2)
+    voltage = struct.unpack("<H", struct.pack(">H", read))[0] * 1.25 / 1000 / 16
+    read = bus.read_word_data(address, 4)
+    capacity = struct.unpack("<H", struct.pack(">H", read))[0] / 256
+    return voltage, capacity
+
+def bench_gauge(): # one VCELL/SOC sample in a single block read
+    import smbus2
+    from gauge import FuelGauge
+    bus = smbus2.SMBus(1)
+    gauge = FuelGauge(bus)
+    assert gauge.refresh() == word_read_gauge(bus)
+    def tick():
+        return gauge.refresh()
+    return tick
+
+def bench_gauge_word():
+    import smbus2
+    bus = smbus2.SMBus(1)
+    def tick():
+        return word_read_gauge(bus)
+    return tick
+
+def rglob_fan_rpm(sysfs): # the per-read lookup sensors.py used before hwmon.py, as the baseline
+    found = list(Path(sysfs, "devices/platform/cooling_fan").rglob("fan1_input"))
+    if not found:
+        return None
+    with open(found[0]) as f:
+        return int(f.read())
+
+def bench_hwmon(): # fan RPM and CPU temperature from the kept-open sysfs nodes
+    from hwmon import SysfsMetrics
+    metrics = SysfsMetrics(HW.sysfs)
+    assert metrics.fan_rpm() == rglob_fan_rpm(HW.sysfs)
+    def tick():
+        return metrics.fan_rpm(), metrics.cpu_temp()
+    return tick
+
+def bench_hwmon_rglob():
+    def tick():
+        with open(Path(HW.sysfs, "class/thermal/thermal_zone0/temp")) as f:
+            return rglob_fan_rpm(HW.sysfs), int(f.read()) / 1000
+    return tick
+
+def bench_hwmon_no_fan(): # no fan fitted: the missing node is looked for every RECHECK reads, not every tick
+    from hwmon import SysfsMetrics
+    sysfs = os.path.join(HW.dir.name, "sys-no-fan")
+    os.makedirs(os.path.join(sysfs, "class/thermal/thermal_zone0"), exist_ok=True)
+    os.makedirs(os.path.join(sysfs, "devices/platform"), exist_ok=True)
+    with open(os.path.join(sysfs, "class/thermal/thermal_zone0/temp"), "w") as f:
+        f.write("51600\n")
+    metrics = SysfsMetrics(sysfs)
+    def tick():
+        return metrics.fan_rpm(), metrics.cpu_temp()
+    return tick
+
+def week_samples(days): # 1 Hz: on AC for 20 hours, then a 4 hour outage, every day
+    for i in range(int(days * 86400)):
+        outage = i % 86400 >= 20 * 3600
+        capacity = 100 - (i % 86400 - 20 * 3600) / 240 if outage else 100.0
+        jitter = (i * 7919) % 97 / 97
+        yield {
+            "time": 1.7e9 + i, "voltage": 3.6 + capacity * 0.006 + jitter * 0.002, "capacity": capacity,
+            "pld": 0 if outage else 1, "charging": capacity < 90,
+            "input_voltage": 5.15 - jitter * 0.01, "cpu_volts": 0.86, "cpu_amps": 1.4 + jitter * 0.2,
+            "watts": 5 + jitter, "rails": {}, "cpu_temp": 51.6 + jitter, "fan_rpm": 2437, "stale": [],
+        }
+
+def bench_gui_week(days=7):
+    app, window = gui_window()
+    app.processEvents()
+    from instrument import Histogram
+    rss = rss_kib()
+    latencies = Histogram() # fixed size, so the harness itself doesn't move the RSS
+    for sample in week_samples(days):
+        start = time.perf_counter()
+        window.update_status(sample)
+        app.processEvents()
+        latencies.record(time.perf_counter() - start)
+    start = time.perf_counter()
+    window.repaint() # everything, with the full history in the plots
+    full = time.perf_counter() - start
+    return {
+        "samples": latencies.count,
+        "latency_us": {
+            "mean": latencies.total / latencies.count * 1e6,
+            "p50": latencies.percentile(50) * 1e6,
+            "p99": latencies.percentile(99) * 1e6,
+            "max": latencies.max * 1e6,
+        },
+        "full_repaint_ms": full * 1000,
+        "rss_growth_kib": rss_kib() - rss,
+        "plot_buckets": {key: len(plot.buffer.lows) for key, plot in window.plots.items()},
+    }
+
+def bench_charge_week(days=7, interval=30): # a pack sitting around the charge threshold, one sample per tick
+    from charge import ChargeController, CHARGE_UPPER
+    line = HW.line(16)
+    now = [0.0]
+    charger = ChargeController(line, clock=lambda: now[0])
+    writes = line.writes
+    flips = 0 # pin changes with the old hard `capacity < 90` edge, which also made a new InputDevice every tick
+    previous = None
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    ticks = int(days * 86400 / interval)
+    for i in range(ticks):
+        now[0] = i * interval
+        capacity = CHARGE_UPPER - 1.5 + 3 * ((i * 7919) % 97 / 97) # +/-1.5% of gauge noise around the threshold
+        charger.update(capacity)
+        flips += previous is not None and (capacity < CHARGE_UPPER) != previous
+        previous = capacity < CHARGE_UPPER
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return {
+        "ticks": ticks,
+        "pin_writes": line.writes - writes,
+        "threshold_pin_changes": flips,
+        "threshold_pin_objects": ticks,
+        "alloc_retained_bytes": retained,
+    }
+
+def bench_gauge_outage(days=7): # one outage a day run down to the watchdog shutdown, host polling against gauge alerts
+    from fakes import FakeSMBus
+    from gauge import FuelGauge
+    from scheduler import AdaptiveScheduler
+    outages = max(1, round(days)) # whole outages, so "week 0.5" still runs one
+    results = {}
+    for name, alerting in (("polling", False), ("alerting", True)):
+        samples = transactions = 0
+        latency = []
+        for day in range(outages):
+            seconds = int((4 + day % 5) * 3600) # 4 to 8 hours from full to empty
+            bus = FakeSMBus(script=[(3.0 + 1.2 * (1 - t / seconds), 100 * (1 - t / seconds)) for t in range(seconds)])
+            gauge = FuelGauge(bus)
+            scheduler = AdaptiveScheduler()
+            if alerting:
+                gauge.configure_alerts(scheduler.critical_capacity, scheduler.critical_voltage)
+            now = 0.0
+            while now < seconds:
+                bus.position = int(now)
+                bus.step()
+                if alerting:
+                    voltage, capacity, rate, alerts = gauge.poll()
+                    decision = scheduler.update(now, 0, voltage, capacity, None, alerts, rate)
+                else:
+                    voltage, capacity = gauge.refresh()
+                    decision = scheduler.update(now, 0, voltage, capacity)
+                samples += 1
+                if decision.shutdown:
+                    latency.append(now - seconds * (1 - scheduler.critical_capacity / 100)) # after the SOC crossing
+                    break
+                now += decision.interval
+            transactions += bus.transactions
+        results[name] = {
+            "samples_per_day": samples / outages,
+            "i2c_per_day": transactions / outages,
+            "max_shutdown_latency_s": max(latency),
+        }
+    return results
+
+def bench_energy(days=7): # constant loads on a jittered 1-30 s sample clock, 4 h on battery and one restart a day
+    from energy import EnergyMeter
+    from sensors import PMIC_RAILS
+    path = os.path.join(HW.dir.name, "energy-bench.json")
+    if os.path.exists(path):
+        os.unlink(path)
+    power = [0.5 + i * 0.25 for i in range(len(PMIC_RAILS))] # W per rail
+    meter = EnergyMeter(path)
+    expected = {"ac": 0.0, "battery": 0.0} # constant load: the trapezoid should be exact
+    now = 0.0
+    appends = 0
+    spent = 0.0
+    previous = None
+    while now < days * 86400:
+        on_battery = now % 86400 >= 20 * 3600
+        if previous is not None and now // 86400 != previous[0] // 86400: # restart at midnight: state file round trip
+            meter.close()
+            meter = EnergyMeter(path)
+            previous = None # the restart gap isn't integrated
+        start = time.perf_counter()
+        meter.append({"time": now, "rail_watts": power, "pld": 0 if on_battery else 1, "stale": []})
+        spent += time.perf_counter() - start
+        if previous is not None:
+            expected["battery" if previous[1] else "ac"] += sum(power) * (now - previous[0]) / 3600
+        previous = (now, on_battery)
+        appends += 1
+        now += 1 + (appends * 7919) % 30 # adaptive sampling, 1 to 30 s
+    meter.close()
+    totals = {source: sum(EnergyMeter(path).totals[source]) for source in expected}
+    return {
+        "appends": appends,
+        "append_us": spent / appends * 1e6,
+        "wh": totals,
+        "expected_wh": expected,
+        "max_relative_error": max((abs(totals[source] - expected[source]) / expected[source] for source in expected if expected[source]), default=0.0),
+    }
+
+PAGE = 4096
+
+class WriteBack:
+    # page-granular model of what reaches the SD card: dirty pages go out on fsync (plus a filesystem
+    # journal commit) or once they have been dirty for `expire` seconds, like dirty_expire_centisecs
+    def __init__(self, expire=30):
+        self.expire = expire
+        self.dirty = set()
+        self.oldest = None
+        self.device = 0
+        self.size = 0
+
+    def write(self, now, length, sync=False):
+        if self.oldest is not None and now - self.oldest >= self.expire:
+            self.device += len(self.dirty) * PAGE
+            self.dirty.clear()
+            self.oldest = None
+        if length:
+            self.dirty.update(range(self.size // PAGE, (self.size + length - 1) // PAGE + 1))
+            self.size += length
+            if self.oldest is None:
+                self.oldest = now
+        if sync:
+            self.device += len(self.dirty) * PAGE + PAGE
+            self.dirty.clear()
+            self.oldest = None
+
+    def total(self):
+        return self.device + len(self.dirty) * PAGE
+
+def bench_journal(days=7): # 1 Hz entries, one outage (power loss + shutdown) a day; reported per day
+    from journal import Journal
+    seconds = int(days * 86400)
+    urgent = {day * 86400 + hour * 3600 for day in range(int(days) + 1) for hour in (20, 23)}
+    def entry(i):
+        return {"capacity": 100 - i % 86400 / 1000, "voltage": 4.1 - i % 86400 / 100000, "pld": int(i not in urgent)}
+    results = {}
+    for name, sync in (("line", False), ("line_fsync", True)): # one write per entry, like a flushed log handler
+        fd = os.open(os.path.join(HW.dir.name, f"{name}.log"), os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_TRUNC, 0o644)
+        model = WriteBack()
+        writes = fsyncs = size = 0
+        for i in range(seconds):
+            data = (json.dumps({"time": 1.7e9 + i, "source": "bench", "event": "sample", **entry(i)}, separators=(",", ":")) + "\n").encode()
+            os.write(fd, data)
+            writes += 1
+            size += len(data)
+            durable = sync or i in urgent
+            if durable:
+                os.fsync(fd)
+                fsyncs += 1
+            model.write(i, len(data), durable)
+        os.close(fd)
+        results[name] = {"bytes": size, "writes": writes, "fsyncs": fsyncs, "device_bytes": model.total()}
+
+    now = [0.0]
+    path = os.path.join(HW.dir.name, "journal.jsonl")
+    if os.path.exists(path):
+        os.unlink(path)
+    journal = Journal("bench", path, clock=lambda: now[0])
+    model = WriteBack()
+    for i in range(seconds):
+        now[0] = i
+        before = (journal.bytes, journal.fsyncs)
+        journal.record("sample", urgent=i in urgent, **entry(i))
+        journal.tick()
+        model.write(i, journal.bytes - before[0], journal.fsyncs != before[1])
+    journal.close()
+    results["journal"] = {"bytes": journal.bytes, "writes": journal.writes, "fsyncs": journal.fsyncs, "device_bytes": model.total()}
+    for result in results.values():
+        for key in list(result):
+            result[key] = result[key] / days
+    return results
+
+SOAKS = {
+    "gui_week": bench_gui_week,
+    "charge_week": bench_charge_week,
+    "journal_per_day": bench_journal,
+    "gauge_outage": bench_gauge_outage,
+    "energy_week": bench_energy,
+}
+
+def soak(days=7):
+    report = report_header(days=days, results={})
+    for name, bench in SOAKS.items():
+        try:
+            report["results"][name] = bench(days)
+        except ImportError as e:
+            report["results"][name] = {"skipped": str(e)}
+    return report
+
+def rss_kib():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+BENCHMARKS = {
+    "terminal": bench_terminal,
+    "gui": bench_gui,
+    "merged": bench_merged,
+    "bat": bench_bat,
+    "pmic_parse": bench_pmic_parse,
+    "pmic_parse_split": bench_pmic_parse_split,
+    "gauge": bench_gauge,
+    "gauge_word": bench_gauge_word,
+    "hwmon": bench_hwmon,
+    "hwmon_rglob": bench_hwmon_rglob,
+    "hwmon_no_fan": bench_hwmon_no_fan,
+}
+
+def spawn(code): # wall time and peak RSS of a fresh interpreter running `code`
+    start = time.perf_counter()
+    pid = os.posix_spawn(sys.executable, [sys.executable, "-c", code], os.environ,
+                         file_actions=[(os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0)])
+    _, status, usage = os.wait4(pid, 0)
+    return time.perf_counter() - start, usage.ru_maxrss, os.waitstatus_to_exitcode(status)
+
+def startup(runs=20, script="merged.py"):
+    # every run installs the fakes first, so the same interpreter + fakes cost is measured alone as the baseline
+    here = os.path.dirname(os.path.abspath(__file__))
+    setup = f"import os, sys; os.chdir({here!r}); sys.path.insert(0, {here!r}); import fakes; fakes.install(); "
+    results = {}
+    for name, code in (("baseline", setup + "sys.exit(0)"),
+                       ("merged", setup + f"sys.argv = [{script!r}]; exec(compile(open({script!r}).read(), {script!r}, 'exec'), {{'__name__': '__main__'}})")):
+        runs_ = [spawn(code) for _ in range(runs)]
+        results[name] = {
+            "wall_ms_p50": percentile([r[0] for r in runs_], 50) * 1000,
+            "wall_ms_min": min(r[0] for r in runs_) * 1000,
+            "peak_rss_kib": max(r[1] for r in runs_),
+            "exit_codes": sorted({r[2] for r in runs_}),
+        }
+    results["net_wall_ms_p50"] = results["merged"]["wall_ms_p50"] - results["baseline"]["wall_ms_p50"]
+    results["net_wall_ms_min"] = results["merged"]["wall_ms_min"] - results["baseline"]["wall_ms_min"]
+    results["net_peak_rss_kib"] = results["merged"]["peak_rss_kib"] - results["baseline"]["peak_rss_kib"]
+    return results
+
+DUMMY_HOOKS = { # name -> shell body
+    "10-flush": "sleep 0.2",
+    "20-fails": "exit 3",
+    "30-slow": "sleep 0.5; sleep 600", # overruns, stops on SIGTERM
+    "40-stubborn": "trap '' TERM; sleep 600 & wait; wait", # ignores SIGTERM, needs SIGKILL
+    "50-flush": "sleep 1",
+}
+
+def shutdown_drill(seconds=4.0, loads=(2, 5, 20, 100)):
+    import shutdown
+    import replay
+    hook_dir = os.path.join(HW.dir.name, "shutdown.d")
+    os.makedirs(hook_dir, exist_ok=True)
+    for name, body in DUMMY_HOOKS.items():
+        path = os.path.join(hook_dir, name)
+        with open(path, "w") as f:
+            f.write(f"#!/bin/sh\n{body}\n")
+        os.chmod(path, 0o755)
+    start = time.perf_counter()
+    hooks = shutdown.run_hooks(shutdown.hooks(hook_dir), seconds, grace=1)
+    results = {
+        "budget_s": seconds,
+        "wall_s": time.perf_counter() - start,
+        "hooks": {hook.name: {"status": hook.status, "seconds": round(hook.seconds, 3)} for hook in hooks},
+        "discharge": {},
+    }
+    for watts in loads: # 8 hours at 5 W, shorter at higher loads
+        prepared = replay.prepare(replay.synthetic(hours=40 / watts, watts=watts))
+        result = replay.replay(prepared, {"ac_loss_shutdown": None})
+        shutdown_at = next(a.time for a in result.actions if a.action == "shutdown")
+        runtime = prepared[6][bisect.bisect_right(prepared[1], prepared[1][0] + shutdown_at) - 1]
+        results["discharge"][f"{watts}W"] = {
+            "predicted_runtime_min": runtime,
+            "hook_budget_s": shutdown.budget(runtime),
+            "poweroff_margin_min": (result.empty - result.poweroff) / 60,
+        }
+    return results
+
+def load_step_trace(pack_wh=40.0, before=5.0, after=20.0, step_at=2 * 3600, outage=600):
+    # a discharge whose load jumps part way through, so the estimate has to follow it
+    import numpy as np
+    import replay
+    t = np.arange(0.0, outage + step_at + pack_wh / after * 3600 + 1)
+    on_battery = t >= outage
+    watts = np.where(t < outage + step_at, before, after)
+    used = np.cumsum(on_battery * watts) / 3600 # Wh, 1 s steps
+    capacity = np.clip(100 - used / pack_wh * 100, 0, 100)
+    voltage = np.interp(capacity, *replay.OCV) - on_battery * 0.01 * watts
+    return replay.Trace("load-step-5W-20W", t, voltage, capacity, (~on_battery).astype(float), watts.astype(float))
+
+def estimator_validation(traces=None, every=600):
+    # estimate_history on a growing history against the time each discharge really emptied: relative error of
+    # the prediction, how often even its lower bound (what shutdown.py budgets with) was too late, the cost of a
+    # call, and that a stale history reads as unknown. A load change still ahead can't be foreseen, so the lower
+    # bound is only judged at checks whose load holds until empty; on the shipped traces it must be late <= 5%
+    import numpy as np
+    import replay
+    from estimator import estimate_history, MAX_AGE, WINDOW
+    from history import History
+    shipped = traces is None
+    if shipped:
+        traces = [replay.synthetic(hours=40 / watts, watts=watts, noise=0.003, seed=watts) for watts in (2, 5, 20)]
+        traces.append(load_step_trace())
+    results = {}
+    for number, trace in enumerate(traces):
+        empty = replay.prepare(trace)[-1]
+        if empty is None:
+            results[trace.name] = {"skipped": "the trace never empties"}
+            continue
+        path = os.path.join(HW.dir.name, f"estimator-{number}.bin")
+        history = History(path, records=len(trace.time))
+        outage = trace.time[np.argmax(trace.pld != 1)]
+        last = np.searchsorted(trace.time, empty)
+        errors, late, steady, missed, calls = [], 0, 0, 0, []
+        for i, now in enumerate(trace.time.tolist()):
+            history.append({"time": now, "voltage": trace.voltage[i], "capacity": trace.capacity[i],
+                            "pld": int(trace.pld[i]), "watts": trace.watts[i]})
+            if i % every or now < outage + WINDOW or now >= empty:
+                continue
+            start = time.perf_counter()
+            result = estimate_history(history, now=now)
+            calls.append((time.perf_counter() - start) * 1e6)
+            actual = (empty - now) / 60
+            if result.state != "discharging":
+                missed += 1
+                continue
+            errors.append((result.minutes - actual) / actual) # > 0: predicted too long
+            window = np.nanmean(trace.watts[np.searchsorted(trace.time, now - WINDOW):i + 1])
+            if abs(np.nanmean(trace.watts[i:last + 1]) / window - 1) < 0.1: # the load holds until empty
+                steady += 1
+                late += result.low > actual
+        stale = estimate_history(history, now=trace.time[-1] + MAX_AGE + 1).state
+        history.close()
+        os.remove(path)
+        results[trace.name] = {
+            "checks": len(calls),
+            "not_discharging": missed,
+            "median_error": float(np.median(errors)) if errors else None,
+            "p90_abs_error": float(np.percentile(np.abs(errors), 90)) if errors else None,
+            "low_too_late": late / steady if steady else None,
+            "load_changed": len(errors) - steady, # checks not judged for low_too_late
+            "call_us_p50": percentile(calls, 50) if calls else None,
+            "stale_state": stale,
+        }
+        if shipped:
+            assert steady and late / steady <= 0.05, (trace.name, late, steady)
+    return results
+
+def event_loop_stalls(app, seconds, period=0.01): # how late a 10 ms Qt timer fires while the loop runs
+    from PyQt5.QtCore import QTimer
+    late = []
+    last = [time.perf_counter()]
+    def beat():
+        now = time.perf_counter()
+        late.append(now - last[0] - period)
+        last[0] = now
+    timer = QTimer()
+    timer.timeout.connect(beat)
+    timer.start(int(period * 1000))
+    QTimer.singleShot(int(seconds * 1000), app.quit)
+    app.exec_()
+    timer.stop()
+    return {"max_ms": max(late) * 1000, "p99_ms": percentile(late, 99) * 1000, "beats": len(late)}
+
+def blocking(seconds=5.0, delay=3.0):
+    # front-ends against sensors that hang: vcgencmd sleeps `delay` seconds (longer than SENSOR_TIMEOUT) and every
+    # I2C transaction a tenth of that. Reports how long the GUI's event loop is blocked with the shipped worker
+    # thread, against sampling on the GUI thread, and how long one terminal tick takes
+    from PyQt5.QtCore import QTimer
+    from x120xd import Collector
+    os.environ["X120X_FAKE_DELAY"] = str(delay)
+    HW.bus.delay = delay / 10
+    results = {"sensor_delay_s": delay}
+    try:
+        app, window = gui_window()
+        requests = QTimer()
+        requests.timeout.connect(window.request_sample) # the worker's 30 s timer, sped up
+        requests.start(500)
+        results["gui_worker_thread"] = event_loop_stalls(app, seconds)
+        requests.stop()
+        collector = Collector()
+        inline = QTimer()
+        inline.timeout.connect(lambda: window.update_status(collector.sample())) # the old way: sample on the GUI thread
+        inline.start(500)
+        results["gui_thread_sampling"] = event_loop_stalls(app, seconds)
+        inline.stop()
+        tick = bench_terminal()
+        ticks = []
+        for _ in range(3):
+            start = time.perf_counter()
+            tick()
+            ticks.append(time.perf_counter() - start)
+        results["terminal_tick_max_s"] = max(ticks) # bounded by SENSOR_TIMEOUT, a hung sensor is reported stale
+    finally:
+        del os.environ["X120X_FAKE_DELAY"]
+        HW.bus.delay = 0.0
+    return results
+
+def clients(counts=(1, 10, 100, 500), seconds=2.0, interval=0.1):
+    # serve() on the fakes with N subscribers: the hardware work per sample should not grow with N
+    import selectors
+    import threading
+    from client import connect
+    from x120xd import Collector, Publisher, serve
+    collector = Collector()
+    results = {}
+    for count in counts:
+        path = os.path.join(HW.dir.name, f"clients-{count}.sock")
+        publisher = Publisher(path)
+        published = [0]
+        publish = publisher.publish
+        def counted(sample):
+            published[0] += 1
+            publish(sample)
+        publisher.publish = counted
+        stop = threading.Event()
+        server = threading.Thread(target=serve, args=(collector, publisher, interval), kwargs={"stop": stop})
+        server.start()
+        socks = [connect(path) for _ in range(count)]
+        received = dict.fromkeys(socks, 0)
+        sel = selectors.DefaultSelector()
+        for sock in socks:
+            sock.setblocking(False)
+            sel.register(sock, selectors.EVENT_READ)
+        transactions, published[0] = HW.bus.transactions, 0
+        end = time.monotonic() + seconds
+        while time.monotonic() < end: # drain every client, like the front-ends would
+            for key, _ in sel.select(0.05):
+                try:
+                    received[key.fileobj] += key.fileobj.recv(1 << 20).count(b"\n")
+                except (BlockingIOError, ConnectionError):
+                    pass
+        transactions = HW.bus.transactions - transactions
+        stop.set()
+        server.join()
+        samples = published[0]
+        results[str(count)] = {
+            "samples": samples,
+            "i2c_per_sample": transactions / samples if samples else None,
+            "received_per_client_min": min(received.values()),
+            "connected_at_end": len(publisher.clients),
+        }
+        sel.close()
+        for sock in socks:
+            sock.close()
+        publisher.close()
+    collector.close()
+    return results
+
+def edge_latency(edges=1000):
+    # FakeLine.set_value() on another thread to PldWatcher.wait() returning, with the waiter blocked in poll()
+    # like merged.py and x120xd.py are between samples
+    import random
+    import threading
+    from pld import PldEdgeSource, PldWatcher
+    line = fakes.FakeLine(1)
+    watcher = PldWatcher(PldEdgeSource(line))
+    sent = []
+    def toggle():
+        for i in range(edges):
+            time.sleep(random.uniform(0.001, 0.003)) # let the waiter block again
+            sent.append(time.perf_counter())
+            line.set_value(i % 2)
+    setter = threading.Thread(target=toggle)
+    setter.start()
+    latency = []
+    for i in range(edges):
+        state = watcher.wait(5)
+        latency.append((time.perf_counter() - sent[i]) * 1e6)
+        assert state == i % 2
+    setter.join()
+    return {
+        "edges": edges,
+        "latency_us": {"p50": percentile(latency, 50), "p99": percentile(latency, 99), "max": max(latency)},
+    }
+
+def scrapes(counts=(1, 8, 32), seconds=2.0):
+    # exporter.make_handler behind a ThreadingHTTPServer, N keep-alive clients scraping as fast as they can
+    import http.client
+    import threading
+    from http.server import ThreadingHTTPServer
+    from exporter import Exposition, make_handler
+    from x120xd import Collector
+    collector = Collector()
+    exposition = Exposition()
+    exposition.update(collector.sample())
+    collector.close()
+    handler = make_handler(exposition)
+    connections = [0]
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        def process_request(self, request, client_address): # once per TCP connection
+            connections[0] += 1
+            super().process_request(request, client_address)
+    results = {}
+    for count in counts:
+        server = Server(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        connections[0] = 0
+        latency = [[] for _ in range(count)]
+        end = time.monotonic() + seconds
+        def scrape(times):
+            conn = http.client.HTTPConnection(*server.server_address)
+            while time.monotonic() < end:
+                start = time.perf_counter()
+                conn.request("GET", "/metrics", headers={"Accept": "application/openmetrics-text"})
+                response = conn.getresponse()
+                response.read()
+                times.append((time.perf_counter() - start) * 1e6)
+            conn.close()
+        threads = [threading.Thread(target=scrape, args=(times,)) for times in latency]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        server.shutdown()
+        server.server_close()
+        every = [t for times in latency for t in times]
+        results[str(count)] = {
+            "requests_per_s": len(every) / seconds,
+            "latency_us": {"p50": percentile(every, 50), "p99": percentile(every, 99)},
+            "connections": connections[0], # one per client if keep-alive holds
+        }
+    return results
+
+def outage_scenarios():
+    # scripted traces for the watchdog on a simulated clock: name, trace, policy, and when it should shut down
+    # (seconds from the start; None: it shouldn't). Drains are due at the SOC crossing, a collapse at the voltage one
+    import numpy as np
+    import replay
+    from scheduler import CRITICAL_CAPACITY, CRITICAL_VOLTAGE
+    def crossing(trace, values, threshold):
+        below = np.flatnonzero((trace.pld != 1) & (values < threshold))
+        return float(trace.time[below[0]]) if len(below) else None
+    t = np.arange(0.0, 86400.0)
+    ac_day = replay.Trace("ac-day", t, np.full(len(t), 4.18), np.full(len(t), 100.0), np.ones(len(t)), np.full(len(t), 5.0))
+    blip = replay.synthetic(outage=600, restore=660)
+    timer = replay.synthetic(outage=600)
+    drain = replay.synthetic(hours=2, watts=20, outage=600)
+    noisy = replay.synthetic(noise=0.01, outage=600)
+    collapse = replay.synthetic(outage=600)
+    sag = np.clip((collapse.time - 600 - 2 * 3600) * 0.002, 0, None) # 2 h in, the pack sags 2 mV/s
+    collapse = collapse._replace(name="voltage-collapse", voltage=collapse.voltage - sag)
+    never = {"ac_loss_shutdown": None}
+    return [
+        ("ac_day", ac_day, {}, None),
+        ("blip_60s", blip, {}, None),
+        ("ac_loss_timer", timer, {}, 600.0 + replay.DEFAULT_POLICY["ac_loss_shutdown"]),
+        ("drain_20W", drain, never, crossing(drain, drain.capacity, CRITICAL_CAPACITY)),
+        ("drain_noisy_5W", noisy, never, crossing(noisy, noisy.capacity, CRITICAL_CAPACITY)),
+        ("voltage_collapse", collapse, never, crossing(collapse, collapse.voltage, CRITICAL_VOLTAGE)),
+    ]
+
+def scenarios():
+    # detection latency from the moment a shutdown is due, and the watchdog's wakeups per hour on AC and on battery
+    import numpy as np
+    import replay
+    results = {}
+    for name, trace, policy, due in outage_scenarios():
+        result = replay.replay(replay.prepare(trace), policy)
+        shutdown_at = next((a.time for a in result.actions if a.source == "watchdog" and a.action == "shutdown"), None)
+        stop = trace.time[-1] if shutdown_at is None else shutdown_at
+        wakes = np.asarray(result.wakeups)
+        on_battery = trace.pld[np.searchsorted(trace.time, wakes, side="right") - 1] != 1
+        battery_hours = np.sum((trace.pld != 1) & (trace.time <= stop)) * np.median(np.diff(trace.time)) / 3600
+        ac_hours = stop / 3600 - battery_hours
+        results[name] = {
+            "due_s": due,
+            "shutdown_s": shutdown_at,
+            "latency_s": None if due is None or shutdown_at is None else shutdown_at - due,
+            "wakeups_per_hour_ac": float(np.sum(~on_battery) / ac_hours) if ac_hours > 0 else None,
+            "wakeups_per_hour_battery": float(np.sum(on_battery) / battery_hours) if battery_hours > 0 else None,
+        }
+    return results
+
+def revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def report_header(**fields): # every report starts the same, then the mode's own fields; "results" is added after the run
+    return {"revision": revision(), "python": platform.python_version(), "machine": platform.machine(),
+            "time": time.time(), **fields}
+
+def run(ticks=200, names=BENCHMARKS):
+    report = report_header(ticks=ticks, results={})
+    sys.addaudithook(audit)
+    for name in names:
+        try:
+            tick = BENCHMARKS[name]()
+        except ImportError as e: # e.g. no PyQt5 for the gui benchmark
+            report["results"][name] = {"skipped": str(e)}
+            continue
+        report["results"][name] = measure(tick, ticks)
+    return report
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["week"]:
+        days = float(sys.argv[2]) if len(sys.argv) > 2 else 7
+        report = soak(days)
+        output = sys.argv[3] if len(sys.argv) > 3 else None
+    elif sys.argv[1:2] == ["startup"]:
+        runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+        report = report_header(runs=runs)
+        report["results"] = {"merged_startup": startup(runs, *sys.argv[3:4])}
+        output = None
+    elif sys.argv[1:2] == ["estimator"]:
+        import replay
+        traces = [replay.load(path) for path in sys.argv[2:]] or None
+        report = report_header()
+        report["results"] = {"estimator": estimator_validation(traces)}
+        output = None
+    elif sys.argv[1:2] == ["blocking"]:
+        seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+        report = report_header()
+        report["results"] = {"blocking": blocking(seconds)}
+        output = None
+    elif sys.argv[1:2] == ["clients"]:
+        counts = tuple(int(n) for n in sys.argv[2].split(",")) if len(sys.argv) > 2 else (1, 10, 100, 500)
+        report = report_header()
+        report["results"] = {"clients": clients(counts)}
+        output = None
+    elif sys.argv[1:2] == ["edges"]:
+        edges = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+        report = report_header()
+        report["results"] = {"pld_edge": edge_latency(edges)}
+        output = None
+    elif sys.argv[1:2] == ["http"]:
+        counts = tuple(int(n) for n in sys.argv[2].split(",")) if len(sys.argv) > 2 else (1, 8, 32)
+        report = report_header()
+        report["results"] = {"http": scrapes(counts)}
+        output = None
+    elif sys.argv[1:2] == ["scenarios"]:
+        report = report_header()
+        report["results"] = {"scenarios": scenarios()}
+        output = None
+    elif sys.argv[1:2] == ["shutdown"]:
+        budget = float(sys.argv[2]) if len(sys.argv) > 2 else 4.0
+        report = report_header()
+        report["results"] = {"shutdown": shutdown_drill(budget)}
+        output = None
+    else:
+        ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+        report = run(ticks)
+        output = sys.argv[2] if len(sys.argv) > 2 else None
+    report = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
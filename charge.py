@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# Battery charge control on GPIO 16: pulled up = charging disabled, pulled down = enabled
+# one line request for the life of the process; the bias is only rewritten on a real transition,
+# with hysteresis between the two thresholds and a minimum time in each state so it can't flap
+
+import time
+import gpiod
+
+CHG_ONOFF_PIN = 16 # pinctrl get 16
+CHARGE_UPPER = 90 # % at or above which charging is disabled
+CHARGE_LOWER = 85 # % at or below which it is enabled again
+CHARGE_DWELL = 300 # seconds in a state before it may change again
+
+def request_charge_line():
+    chip = gpiod.Chip('gpiochip0') # since kernel release 6.6.45 you have to use 'gpiochip0' - before it was 'gpiochip4'
+    line = chip.get_line(CHG_ONOFF_PIN)
+    line.request(consumer="CHG_ONOFF", type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_DOWN)
+    return line
+
+class ChargeController:
+    def __init__(self, line, upper=CHARGE_UPPER, lower=CHARGE_LOWER, dwell=CHARGE_DWELL, clock=time.monotonic):
+        self.line = line
+        self.upper = upper
+        self.lower = lower
+        self.dwell = dwell
+        self.clock = clock
+        self.enabled = None # unknown until the first capacity reading
+        self.changed = None # clock time of the last write
+        self.writes = 0
+
+    def update(self, capacity): # True if charging is enabled
+        if capacity is None: # no gauge reading, leave the pin alone
+            return self.enabled if self.enabled is not None else True
+        now = self.clock()
+        if self.enabled is None:
+            self.set(capacity < self.upper, now)
+        elif now - self.changed >= self.dwell:
+            if self.enabled and capacity >= self.upper:
+                self.set(False, now)
+            elif not self.enabled and capacity <= self.lower:
+                self.set(True, now)
+        return self.enabled
+
+    def set(self, enabled, now):
+        self.line.set_flags(gpiod.LINE_REQ_FLAG_BIAS_PULL_DOWN if enabled else gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
+        self.enabled = enabled
+        self.changed = now
+        self.writes += 1
+
+    def close(self):
+        self.line.release()
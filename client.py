@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Client side of the x120xd.py socket: one JSON sample per line, the latest one on connect
+# no hardware or numpy imports, so a one-shot merged.py run that only needs the PLD state stays cheap
+# a client may write "sample" (take a fresh sample now) or "stats" (instrumentation report)
+
+import json
+import os
+import socket
+import time
+
+SOCKET_PATH = os.environ.get("X120X_SOCKET", "/run/x120x.sock") # fakes.py points it at a temp dir
+RECONNECT_DELAYS = (1, 2, 4, 8) # seconds between attempts to reach a restarting daemon, before reading the hardware
+
+def connect(path=None): # None if the daemon isn't running
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path or SOCKET_PATH)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+def reconnect(path=None, delays=RECONNECT_DELAYS): # None if the daemon didn't come back
+    for delay in delays:
+        time.sleep(delay)
+        sock = connect(path)
+        if sock is not None:
+            return sock
+    return None
+
+def subscribe(sock):
+    with sock, sock.makefile("r") as lines:
+        for line in lines:
+            yield json.loads(line)
+
+def query_stats(path=None):
+    sock = connect(path)
+    if sock is None:
+        return None
+    sock.sendall(b"stats\n")
+    for message in subscribe(sock): # skip samples until the reply arrives
+        if "stats" in message:
+            return message["stats"]
+
+class Subscription:
+    # the pushed samples with a timeout, for a client that has its own schedule (merged.py)
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b""
+
+    def next(self, timeout=None): # the next message, None after `timeout` seconds; ConnectionError once the daemon is gone
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while b"\n" not in self.buffer:
+            left = None if deadline is None else deadline - time.monotonic()
+            if left is not None and left <= 0:
+                return None
+            self.sock.settimeout(left)
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                return None
+            if not data:
+                raise ConnectionError("x120xd.py closed the connection")
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def request(self): # the daemon samples at once and publishes the result to every client
+        self.sock.sendall(b"sample\n")
+
+    def close(self):
+        self.sock.close()
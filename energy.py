@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# Energy accounting: watt-hours per PMIC rail, on AC and on battery, integrated by x120xd.py
+# each interval between two samples is a trapezoid of the rail's power, booked to the power source it started on;
+# the totals are rewritten (atomic replace) every SAVE_INTERVAL seconds and on exit, so they survive restarts
+# usage: energy.py [path]: print the totals
+
+import json
+import os
+import sys
+import time
+from sensors import PMIC_RAILS
+
+ENERGY_PATH = os.environ.get("X120X_ENERGY", "/var/lib/x120x/energy.json") # fakes.py points it at a temp dir
+SAVE_INTERVAL = 600 # seconds between state file writes
+MAX_GAP = 300 # seconds; a longer gap between samples (daemon stopped, clock step) is not integrated
+GAP_INTERVALS = 3 # ... or, with a slower sampling interval, this many intervals (a couple of missed samples)
+SOURCES = ("ac", "battery")
+
+class EnergyMeter:
+    def __init__(self, path=ENERGY_PATH, interval=SAVE_INTERVAL, clock=time.monotonic, sample_interval=None):
+        self.path = path
+        self.interval = interval
+        self.max_gap = MAX_GAP if sample_interval is None else max(MAX_GAP, GAP_INTERVALS * sample_interval)
+        self.clock = clock
+        self.due = clock() + interval
+        self.totals = {source: [0.0] * len(PMIC_RAILS) for source in SOURCES} # Wh, indexed like PMIC_RAILS
+        self.since = time.time() # when accounting started, kept across restarts
+        self.last = None # (time, rail watts, on battery) of the previous sample
+        self.load()
+
+    def load(self): # totals from the state file; a missing or torn file starts from zero
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            self.since = state["since"]
+            for source in SOURCES:
+                saved = state[source]
+                self.totals[source] = [float(saved.get(name, 0.0)) for name in PMIC_RAILS]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+
+    def append(self, sample): # O(rails) per sample
+        power = sample.get("rail_watts")
+        if power is None or "pmic" in sample.get("stale", ()): # no reading, don't integrate across the hole
+            self.last = None
+            return
+        now = sample["time"]
+        if self.last is not None:
+            then, previous, on_battery = self.last
+            dt = now - then
+            if 0 < dt <= self.max_gap:
+                totals = self.totals["battery" if on_battery else "ac"]
+                for i, (a, b) in enumerate(zip(previous, power)):
+                    if a is not None and b is not None:
+                        totals[i] += (a + b) * dt / 7200
+        self.last = (now, power, sample.get("pld") == 0)
+        if self.clock() >= self.due:
+            self.save()
+
+    def report(self): # {"ac": {rail: Wh}, "battery": {rail: Wh}, "since": time}
+        state = {source: dict(zip(PMIC_RAILS, self.totals[source])) for source in SOURCES}
+        state["since"] = self.since
+        return state
+
+    def save(self, sync=False):
+        self.due = self.clock() + self.interval
+        temp = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(temp, "w") as f:
+                json.dump(self.report(), f, separators=(",", ":"))
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(temp, self.path) # readers and a power cut see the old file or the new one
+        except OSError as e:
+            print(f"Error writing {self.path}: {e}")
+
+    def close(self):
+        self.save(sync=True)
+
+if __name__ == "__main__":
+    meter = EnergyMeter(sys.argv[1] if len(sys.argv) > 1 else ENERGY_PATH)
+    state = meter.report()
+    print(f"Since {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(state['since']))}")
+    print(f"{'rail':<12}{'AC Wh':>12}{'battery Wh':>12}")
+    for name in PMIC_RAILS:
+        print(f"{name:<12}{state['ac'][name]:>12.3f}{state['battery'][name]:>12.3f}")
+    print(f"{'total':<12}{sum(state['ac'].values()):>12.3f}{sum(state['battery'].values()):>12.3f}")
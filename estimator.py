@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Time-to-empty / time-to-full from the recent SOC and voltage trend
+# discharge is fitted against the energy drawn (trapezoid of the measured system watts) rather than
+# wall-clock time, so a load change moves the prediction straight away instead of after a full window
+
+import sys
+import time
+from collections import namedtuple
+import numpy as np
+
+WINDOW = 15 * 60 # seconds of history in each fit
+EMPTY_SOC = 3.0 # % the gauge still reads when the loaded pack hits the ~3.0 V cut-off (OCV ~3.18 V, less the sag)
+EMPTY_VOLTAGE = 3.20 # same cut-off as merged.py and bat.py
+FULL_SOC = 100.0
+Z = 1.96 # 95% confidence band
+MODEL_ERROR = 0.1 # relative error of the rate the fit can't see (SOC nonlinearity, gauge calibration), added to the band
+MIN_INTERVAL = 1.0 # seconds; x120xd.py records no faster, so WINDOW / MIN_INTERVAL records cover a window
+MAX_AGE = 90 # seconds, three x120xd.py intervals: an older newest record means the daemon has stopped
+STALE_INTERVALS = 3 # ... or this many of the history's own sampling intervals, if it samples slower
+
+Estimate = namedtuple("Estimate", "state minutes low high") # state: discharging, charging, idle or unknown
+
+def bridge(watts): # gaps in watts (no PMIC reading) take the load on either side, zero if there is none at all
+    watts = np.asarray(watts, dtype=float)
+    have = np.flatnonzero(np.isfinite(watts))
+    if len(have) == 0:
+        return np.zeros(len(watts))
+    return np.interp(np.arange(len(watts)), have, watts[have])
+
+def energy_wh(t, watts): # cumulative Wh at each sample, trapezoidal
+    watts = bridge(watts)
+    energy = np.zeros(len(t))
+    np.cumsum((watts[1:] + watts[:-1]) * np.diff(t) / 7200, out=energy[1:])
+    return energy
+
+def fit(x, y): # least squares line: slope, its standard error, fitted y at the last x
+    n = len(x)
+    dx = x - x.mean()
+    sxx = dx @ dx
+    if n < 3 or sxx <= 0:
+        return 0.0, np.inf, y[-1]
+    y_mean = y.mean()
+    slope = dx @ (y - y_mean) / sxx
+    residual = y - y_mean - slope * dx
+    se = np.sqrt(residual @ residual / (n - 2) / sxx)
+    return slope, se, y_mean + slope * dx[-1]
+
+def _minutes(remaining, rate, se): # remaining / rate, with the band from rate -/+ Z*se and the model error
+    spread = np.hypot(Z * se, MODEL_ERROR * rate)
+    fastest = rate + spread
+    slowest = rate - spread
+    return (float(remaining / rate / 60),
+            float(remaining / fastest / 60),
+            float(remaining / slowest / 60) if slowest > 0 else float("inf"))
+
+def estimate(t, soc, voltage, watts, window=WINDOW):
+    t = np.asarray(t, dtype=float)
+    start = np.searchsorted(t, t[-1] - window) if len(t) else 0
+    t = t[start:] - t[-1] if len(t) else t
+    soc = np.asarray(soc, dtype=float)[start:]
+    voltage = np.asarray(voltage, dtype=float)[start:]
+    watts = np.asarray(watts, dtype=float)[start:]
+    if len(t) < 3:
+        return Estimate("unknown", None, None, None)
+
+    soc_rate, soc_se, soc_now = fit(t, soc) # %/s
+    if soc_rate > Z * soc_se: # charging
+        minutes, low, high = _minutes(max(FULL_SOC - soc_now, 0.0), soc_rate, soc_se)
+        return Estimate("charging", minutes, low, high)
+    if soc_rate >= -Z * soc_se: # no significant trend either way
+        return Estimate("idle", None, None, None)
+
+    load = watts[-10:][np.isfinite(watts[-10:])]
+    energy = energy_wh(t, watts)
+    if len(load) and energy[-1] > 0: # %/Wh scaled by the present load
+        per_wh, per_wh_se, soc_now = fit(energy, soc)
+        rate, se = -per_wh * load.mean() / 3600, per_wh_se * load.mean() / 3600
+    else:
+        rate, se = -soc_rate, soc_se
+    if rate <= 0:
+        rate, se = -soc_rate, soc_se
+    minutes, low, high = _minutes(max(soc_now - EMPTY_SOC, 0.0), rate, se)
+
+    volt_rate, volt_se, volt_now = fit(t, voltage) # the pack can hit the voltage cut-off first
+    if -volt_rate > Z * volt_se:
+        v_minutes, v_low, v_high = _minutes(max(volt_now - EMPTY_VOLTAGE, 0.0), -volt_rate, volt_se)
+        if v_minutes < minutes:
+            minutes, low, high = v_minutes, min(low, v_low), min(high, v_high)
+    return Estimate("discharging", minutes, low, high)
+
+def estimate_history(history, window=WINDOW, now=None): # latest estimate from an open history.History, unknown if stale
+    records = history.tail(int(window / MIN_INTERVAL) + 1) # never the whole ring
+    if len(records) < 2:
+        return Estimate("unknown", None, None, None)
+    t = records["time"]
+    age = (time.time() if now is None else now) - t[-1]
+    if age > max(MAX_AGE, STALE_INTERVALS * float(np.median(np.diff(t[-10:])))):
+        return Estimate("unknown", None, None, None)
+    start = np.searchsorted(t, t[-1] - window)
+    return estimate(t[start:], records["capacity"][start:], records["voltage"][start:], records["watts"][start:], window)
+
+def runtime_series(t, soc, watts, window=WINDOW): # minutes to EMPTY_SOC at every sample, NaN unless discharging
+    t = np.asarray(t, dtype=float)
+    soc = np.asarray(soc, dtype=float)
+    watts = bridge(watts)
+    x = energy_wh(t, watts) # rolling least squares of SOC over energy via prefix sums, O(n)
+    sums = [np.concatenate(([0.0], np.cumsum(v))) for v in (np.ones_like(x), x, soc, x * x, x * soc)]
+    end = np.arange(1, len(t) + 1)
+    begin = np.searchsorted(t, t - window)
+    n, sx, sy, sxx, sxy = (s[end] - s[begin] for s in sums)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        per_wh = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        soc_now = (sy - per_wh * sx) / n + per_wh * x
+        minutes = (soc_now - EMPTY_SOC) / (-per_wh * watts / 3600) / 60
+    minutes[~(per_wh < 0) | (n < 3)] = np.nan
+    return minutes
+
+if __name__ == "__main__": # estimator.py [path]: runtime from the x120xd.py history
+    from history import History, HISTORY_PATH
+    history = History(sys.argv[1] if len(sys.argv) > 1 else HISTORY_PATH, writable=False)
+    result = estimate_history(history)
+    if result.minutes is None:
+        print(f"Battery {result.state}")
+    else:
+        print(f"Battery {result.state}: {result.minutes:.0f} min ({result.low:.0f}-{result.high:.0f} min)")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# OpenMetrics/Prometheus exporter for the X120x UPS and Pi 5 power telemetry
+# samples come from x120xd.py (or straight from the hardware when it isn't running) on a background thread;
+# the exposition text is rendered once per sample, so a scrape only copies cached bytes
+# usage: exporter.py [port] [address]
+
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from x120xd import samples
+
+PORT = 9120
+OPENMETRICS = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS = "text/plain; version=0.0.4; charset=utf-8"
+
+METRICS = [ # sample field, metric name, unit, help
+    ("voltage", "x120x_battery_volts", "volts", "Cell voltage, filtered and corrected for load sag on battery."),
+    ("capacity", "x120x_battery_capacity_percent", "percent", "State of charge, filtered."),
+    ("raw_voltage", "x120x_battery_raw_volts", "volts", "Fuel gauge cell voltage as read (VCELL)."),
+    ("raw_capacity", "x120x_battery_raw_capacity_percent", "percent", "Fuel gauge state of charge as read (SOC)."),
+    ("pld", "x120x_ac_power_ok", None, "1 if AC power is present (PLD), 0 on power loss."),
+    ("charging", "x120x_charging_enabled", None, "1 if battery charging is enabled."),
+    ("watts", "x120x_system_watts", "watts", "Total Pi 5 power from the PMIC rails."),
+    ("cpu_temp", "x120x_cpu_temperature_celsius", "celsius", "CPU temperature."),
+    ("fan_rpm", "x120x_fan_rpm", None, "Cooling fan speed."),
+    ("time", "x120x_sample_timestamp_seconds", "seconds", "When the sample was taken."),
+]
+
+def _number(value):
+    return repr(float(value)) if not isinstance(value, bool) else str(int(value))
+
+def render(sample, openmetrics=True):
+    lines = []
+    def family(name, unit, help_):
+        lines.append(f"# TYPE {name} gauge")
+        if unit and openmetrics:
+            lines.append(f"# UNIT {name} {unit}")
+        lines.append(f"# HELP {name} {help_}")
+
+    for key, name, unit, help_ in METRICS:
+        value = sample.get(key)
+        if value is None:
+            continue
+        family(name, unit, help_)
+        lines.append(f"{name} {_number(value)}")
+
+    rails = sample.get("rails") or {}
+    for suffix, unit, help_ in (("_V", "volts", "PMIC rail voltage."), ("_A", "amps", "PMIC rail current.")):
+        name = f"x120x_pmic_rail_{unit}"
+        family(name, unit, help_)
+        for label, value in sorted(rails.items()):
+            if label.endswith(suffix):
+                lines.append(f'{name}{{rail="{label[:-2]}"}} {_number(value)}')
+
+    energy = sample.get("energy")
+    if energy:
+        name = "x120x_rail_energy_watt_hours"
+        declared = name if openmetrics else name + "_total" # OpenMetrics names the family without the suffix
+        lines.append(f"# TYPE {declared} counter")
+        lines.append(f"# HELP {declared} Energy used by each PMIC rail since accounting started, by power source.")
+        for source in ("ac", "battery"):
+            for rail, value in sorted(energy[source].items()):
+                lines.append(f'{name}_total{{rail="{rail}",source="{source}"}} {_number(value)}')
+
+    family("x120x_sensor_stale", None, "1 if the sensor missed its deadline and the value is the last good one.")
+    for sensor in ("gauge", "pmic", "cpu_temp", "fan_rpm"):
+        lines.append(f'x120x_sensor_stale{{sensor="{sensor}"}} {int(sensor in sample.get("stale", ()))}')
+    if openmetrics:
+        lines.append("# EOF")
+    return ("\n".join(lines) + "\n").encode()
+
+class Exposition:
+    def __init__(self):
+        self.bodies = {True: b"# EOF\n", False: b""} # openmetrics -> rendered text
+
+    def update(self, sample):
+        self.bodies = {True: render(sample, True), False: render(sample, False)} # swapped in one assignment
+
+    def follow(self, interval):
+        while True: # resubscribe if the daemon restarts
+            try:
+                for sample in samples(interval):
+                    self.update(sample)
+            except (OSError, ValueError) as e:
+                print(f"Error reading samples: {e}")
+            time.sleep(interval)
+
+def make_handler(exposition):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # keep-alive for frequent scrapers
+        disable_nagle_algorithm = True # headers and body go out as separate writes
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            body = exposition.bodies[openmetrics]
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS if openmetrics else PROMETHEUS)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args): # no per-scrape logging
+            pass
+
+    return MetricsHandler
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else PORT
+    address = sys.argv[2] if len(sys.argv) > 2 else ""
+    exposition = Exposition()
+    threading.Thread(target=exposition.follow, args=(5,), daemon=True).start()
+    server = ThreadingHTTPServer((address, port), make_handler(exposition))
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# Fake hardware for running the X120x scripts without a Pi 5 or a UPS HAT
+# install() puts fake smbus2 and gpiod modules in sys.modules, a fake vcgencmd on PATH
+# and a fake sysfs tree under a temp dir; everything it returns counts the work done against it
+
+import os
+import stat
+import sys
+import tempfile
+import time
+import types
+
+PMIC_RAILS = { # canned `vcgencmd pmic_read_adc` readings from a Pi 5 under light load
+    "3V7_WL_SW": (3.708, 0.0039),
+    "3V3_SYS": (3.315, 0.0892),
+    "1V8_SYS": (1.796, 0.1513),
+    "DDR_VDD2": (1.107, 0.0175),
+    "DDR_VDDQ": (0.603, 0.0000),
+    "1V1_SYS": (1.104, 0.1937),
+    "0V8_SW": (0.802, 0.3308),
+    "VDD_CORE": (0.861, 1.4762),
+    "3V3_DAC": (3.310, 0.0001),
+    "3V3_ADC": (3.309, 0.0002),
+    "0V8_AON": (0.801, 0.0045),
+    "HDMI": (5.140, 0.0254),
+}
+
+def pmic_read_adc_output(rails=PMIC_RAILS): # same layout as the real command: currents first, then volts
+    lines = [f"{name + '_A':>14} current({i})={amps:.8f}A" for i, (name, (volts, amps)) in enumerate(rails.items())]
+    lines += [f"{name + '_V':>14} volt({i + 12})={volts:.8f}V" for i, (name, (volts, amps)) in enumerate(rails.items())]
+    lines.append(f"{'EXT5V_V':>14} volt(24)=5.15649000V")
+    lines.append(f"{'BATT_V':>14} volt(25)=0.00000000V")
+    return "\n".join(lines) + "\n"
+
+class FakeSMBus:
+    # register-level 0x36 fuel gauge; registers are 16 bit big endian like the real chip
+    # CRATE follows the scripted SOC, and crossing the CONFIG/VALRT thresholds latches STATUS and CONFIG.ALRT
+    def __init__(self, bus=1, script=None, seconds=1.0):
+        self.memory = bytearray(256)
+        self.transactions = 0
+        self.script = list(script or [(4.1, 85.0)]) # (voltage, capacity) per step, the last one repeats
+        self.seconds = seconds # chip time per step, for CRATE
+        self.delay = 0.0 # wall seconds each transaction sleeps, for a bus that hangs
+        self.position = 0
+        self.memory[0x0C:0x0E] = (0x97, 0x1C) # CONFIG reset value, empty alert at 4%
+        self.memory[0x14:0x16] = (0x00, 0xFF) # VALRT reset value, voltage alerts off
+        self.memory[0x1A] = 0x01 # STATUS.RI after power-on
+        self.step()
+
+    def set(self, voltage, capacity):
+        soc = self.register(0x04) / 256
+        self.set_register(0x02, round(voltage * 16000 / 1.25)) # VCELL, 78.125 uV/LSB
+        self.set_register(0x04, round(capacity * 256)) # SOC, 1/256 %/LSB
+        if self.position:
+            self.set_register(0x16, round((capacity - soc) * 3600 / self.seconds / 0.208) & 0xFFFF) # CRATE, 0.208 %/h/LSB
+        flags = 0
+        if soc >= 32 - (self.memory[0x0D] & 0x1F) > capacity: # HD: SOC fell through the empty threshold
+            flags |= 0x10
+        if voltage < self.memory[0x14] * 0.02: # VL
+            flags |= 0x04
+        if voltage > self.memory[0x15] * 0.02: # VH
+            flags |= 0x02
+        if flags:
+            self.memory[0x1A] |= flags
+            self.memory[0x0D] |= 0x20 # CONFIG.ALRT
+
+    def step(self):
+        self.set(*self.script[min(self.position, len(self.script) - 1)])
+        self.position += 1
+
+    def register(self, reg):
+        return self.memory[reg] << 8 | self.memory[reg + 1]
+
+    def set_register(self, reg, value):
+        self.memory[reg] = value >> 8 & 0xFF
+        self.memory[reg + 1] = value & 0xFF
+
+    def transaction(self):
+        self.transactions += 1
+        if self.delay:
+            time.sleep(self.delay)
+
+    def read_word_data(self, address, reg): # SMBus words are little endian
+        self.transaction()
+        return self.memory[reg] | self.memory[reg + 1] << 8
+
+    def write_word_data(self, address, reg, value):
+        self.transaction()
+        self.memory[reg] = value & 0xFF
+        self.memory[reg + 1] = value >> 8 & 0xFF
+
+    def read_i2c_block_data(self, address, reg, length):
+        self.transaction()
+        return list(self.memory[reg:reg + length])
+
+    def write_i2c_block_data(self, address, reg, data):
+        self.transaction()
+        self.memory[reg:reg + len(data)] = bytes(data)
+
+    def close(self):
+        pass
+
+class FakeLineEvent:
+    RISING_EDGE = 1
+    FALLING_EDGE = 2
+
+    def __init__(self, type):
+        self.type = type
+
+class FakeLine:
+    # gpiod v1 line; set_value() queues an edge event on a pipe like the kernel would
+    def __init__(self, value=1):
+        self.value = value
+        self.read_fd, self.write_fd = os.pipe()
+        self.reads = 0
+        self.flags = 0
+        self.requests = 0
+        self.writes = 0 # bias changes after the request
+
+    def request(self, consumer=None, type=None, flags=0):
+        self.requests += 1
+        self.flags = flags
+
+    def set_flags(self, flags):
+        self.writes += 1
+        self.flags = flags
+
+    def get_value(self):
+        self.reads += 1
+        return self.value
+
+    def set_value(self, value):
+        if value != self.value:
+            self.value = value
+            os.write(self.write_fd, bytes([FakeLineEvent.RISING_EDGE if value else FakeLineEvent.FALLING_EDGE]))
+
+    def event_get_fd(self):
+        return self.read_fd
+
+    def event_read(self):
+        return FakeLineEvent(os.read(self.read_fd, 1)[0])
+
+    def release(self):
+        pass
+
+class FakeHardware:
+    def __init__(self, script=None, pld=1):
+        self.bus = FakeSMBus(script=script)
+        self.lines = {6: FakeLine(pld)}
+        self.dir = tempfile.TemporaryDirectory(prefix="x120x-fake-")
+        self.sysfs = os.path.join(self.dir.name, "sys")
+
+    def line(self, pin):
+        return self.lines.setdefault(pin, FakeLine(0))
+
+    def step(self): # next scripted gauge reading
+        self.bus.step()
+
+def _write_vcgencmd(directory, rails):
+    output = os.path.join(directory, "pmic_read_adc.txt")
+    with open(output, "w") as f:
+        f.write(pmic_read_adc_output(rails))
+    script = os.path.join(directory, "vcgencmd")
+    with open(script, "w") as f:
+        f.write("#!/bin/sh\n"
+                "[ -n \"$X120X_FAKE_DELAY\" ] && sleep \"$X120X_FAKE_DELAY\" # a firmware call that stalls\n"
+                "case \"$1\" in\n"
+                f"  pmic_read_adc) if [ -n \"$2\" ]; then grep \"$2\" {output}; else cat {output}; fi ;;\n"
+                "  measure_temp) echo \"temp=51.6'C\" ;;\n"
+                "  *) exit 1 ;;\n"
+                "esac\n")
+    os.chmod(script, os.stat(script).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+def _write_sysfs(root):
+    fan = os.path.join(root, "devices/platform/cooling_fan/hwmon/hwmon3")
+    thermal = os.path.join(root, "class/thermal/thermal_zone0")
+    os.makedirs(fan)
+    os.makedirs(thermal)
+    with open(os.path.join(fan, "fan1_input"), "w") as f:
+        f.write("2437\n")
+    with open(os.path.join(thermal, "temp"), "w") as f:
+        f.write("51600\n")
+
+def install(script=None, pld=1, rails=PMIC_RAILS): # must run before the scripts import their hardware modules
+    hw = FakeHardware(script, pld)
+
+    smbus2 = types.ModuleType("smbus2")
+    smbus2.SMBus = lambda bus=1: hw.bus
+
+    gpiod = types.ModuleType("gpiod")
+    gpiod.LINE_REQ_DIR_IN = 1
+    gpiod.LINE_REQ_EV_BOTH_EDGES = 2
+    gpiod.LINE_REQ_FLAG_BIAS_DISABLE = 8
+    gpiod.LINE_REQ_FLAG_BIAS_PULL_DOWN = 16
+    gpiod.LINE_REQ_FLAG_BIAS_PULL_UP = 32
+    gpiod.LineEvent = FakeLineEvent
+    gpiod.Chip = lambda name: types.SimpleNamespace(get_line=hw.line)
+
+    sys.modules.update(smbus2=smbus2, gpiod=gpiod)
+
+    _write_vcgencmd(hw.dir.name, rails)
+    os.environ["PATH"] = hw.dir.name + os.pathsep + os.environ.get("PATH", "")
+    _write_sysfs(hw.sysfs)
+    os.environ["X120X_SYSFS"] = hw.sysfs # read when hwmon is imported
+    os.environ["X120X_JOURNAL"] = os.path.join(hw.dir.name, "events.jsonl") # and journal
+    os.environ["X120X_ENERGY"] = os.path.join(hw.dir.name, "energy.json") # and energy
+    os.environ["X120X_SOCKET"] = os.path.join(hw.dir.name, "x120x.sock") # and client, no daemon there unless started
+    if "hwmon" in sys.modules:
+        sys.modules["hwmon"].SYSFS = hw.sysfs
+    return hw
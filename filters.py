@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# Noise filter between the fuel gauge and every threshold decision
+# each signal is a steady-state scalar Kalman filter (random walk plus white measurement noise): an EMA whose
+# weight follows the time since the previous sample, so it suits both 1 Hz and adaptive sampling. O(1) per sample.
+# on battery the voltage is corrected for load transients: the sag from the load above its own average,
+# R * dI, is added back, so a spike in watts doesn't look like an empty pack but a sustained load still does
+# filter_arrays() runs the same filter over recorded arrays with numpy, matching the streaming results
+# usage: filters.py trace.csv|history.bin|--synthetic [threshold]: false threshold crossings, raw against filtered
+
+import math
+import sys
+from collections import namedtuple
+
+VOLTAGE_Q = 1e-5 # V^2/s the true voltage may wander by
+VOLTAGE_R = 4e-4 # V^2 of reading noise and sag, ~20 mV
+CAPACITY_Q = 1e-3 # %^2/s
+CAPACITY_R = 0.25 # %^2
+LOAD_Q = 2e-3 # W^2/s, a slow average of the load the transients are measured against
+LOAD_R = 1.0 # W^2
+RESISTANCE = 0.05 # ohm, pack plus wiring
+EFFICIENCY = 0.9 # boost converter, battery watts = system watts / EFFICIENCY
+THRESHOLD = 3.20 # V, the watchdog's critical voltage
+BLOCK = 32 # samples per vectorised block in filter_arrays
+
+Reading = namedtuple("Reading", "voltage capacity raw_voltage raw_capacity")
+
+def gain(dt, q, r): # steady-state Kalman gain for a sample `dt` seconds after the previous one
+    p = q * dt
+    p = (p + math.sqrt(p * p + 4 * p * r)) / 2 # prior variance
+    return p / (p + r)
+
+class Kalman:
+    __slots__ = ("q", "r", "value", "time")
+
+    def __init__(self, q, r):
+        self.q = q
+        self.r = r
+        self.value = None
+        self.time = None
+
+    def update(self, now, z): # z None: no reading, keep the estimate
+        if z is None:
+            return self.value
+        if self.value is None:
+            self.value = z
+        elif now > self.time:
+            self.value += gain(now - self.time, self.q, self.r) * (z - self.value)
+        self.time = now
+        return self.value
+
+class BatteryFilter:
+    def __init__(self, resistance=RESISTANCE):
+        self.resistance = resistance # 0 turns the load compensation off
+        self.voltage = Kalman(VOLTAGE_Q, VOLTAGE_R)
+        self.capacity = Kalman(CAPACITY_Q, CAPACITY_R)
+        self.load = Kalman(LOAD_Q, LOAD_R)
+
+    def update(self, now, voltage, capacity, watts=None, on_battery=True):
+        z = voltage
+        if watts is not None:
+            average = self.load.value
+            if voltage is not None and on_battery and average is not None:
+                z = voltage + self.resistance * (watts - average) / EFFICIENCY / voltage
+            self.load.update(now, watts)
+        return Reading(self.voltage.update(now, z), self.capacity.update(now, capacity), voltage, capacity)
+
+def _smooth(np, t, z, q, r): # Kalman.update over arrays: a recursive EMA, solved BLOCK samples at a time
+    x = np.full(len(z), np.nan)
+    if len(z) == 0:
+        return x
+    x[0] = z[0]
+    n = len(z) - 1
+    if n == 0:
+        return x
+    p = q * np.maximum(np.diff(t), 0.0)
+    p = (p + np.sqrt(p * p + 4 * p * r)) / 2
+    k = np.minimum(p / (p + r), 1 - 1e-6) # keeps exp(-decay) finite within a block
+    blocks = -(-n // BLOCK)
+    pad = blocks * BLOCK - n
+    k = np.concatenate([k, np.zeros(pad)]).reshape(blocks, BLOCK)
+    zz = np.concatenate([z[1:], np.zeros(pad)]).reshape(blocks, BLOCK)
+    decay = np.cumsum(np.log1p(-k), axis=1) # log of the weight the block's start value keeps
+    keep = np.exp(decay)
+    y = keep * np.cumsum(k * zz / keep, axis=1) # each block from a zero start
+    start = x[0]
+    for b in range(blocks): # carry the state across blocks, one scalar step each
+        y[b] += keep[b] * start
+        start = y[b, -1]
+    x[1:] = y.reshape(-1)[:n]
+    return x
+
+def filter_arrays(t, voltage, capacity, watts=None, pld=None, resistance=RESISTANCE):
+    # filtered (voltage, capacity) over recorded arrays; NaN readings are skipped like None in BatteryFilter
+    import numpy as np
+    t = np.asarray(t, dtype=float)
+    voltage = np.asarray(voltage, dtype=float)
+    capacity = np.asarray(capacity, dtype=float)
+    z = voltage.copy()
+    if watts is not None:
+        watts = np.asarray(watts, dtype=float)
+        have = np.flatnonzero(np.isfinite(watts))
+        average = np.full(len(t), np.nan) # the load average before each sample's own update
+        average[have[1:]] = _smooth(np, t[have], watts[have], LOAD_Q, LOAD_R)[:-1]
+        on_battery = np.ones(len(t), dtype=bool) if pld is None else np.asarray(pld) != 1
+        fix = on_battery & np.isfinite(average) & np.isfinite(voltage)
+        z[fix] += resistance * (watts[fix] - average[fix]) / EFFICIENCY / voltage[fix]
+    results = []
+    for values, q, r in ((z, VOLTAGE_Q, VOLTAGE_R), (capacity, CAPACITY_Q, CAPACITY_R)):
+        have = np.flatnonzero(np.isfinite(values))
+        out = np.full(len(t), np.nan)
+        out[have] = _smooth(np, t[have], values[have], q, r)
+        results.append(_hold(np, out))
+    return tuple(results)
+
+def _hold(np, x): # a missing reading keeps the last estimate
+    index = np.where(np.isfinite(x), np.arange(len(x)), 0)
+    np.maximum.accumulate(index, out=index)
+    return x[index]
+
+def false_triggers(t, values, pld, threshold=THRESHOLD, confirm=1):
+    # dips below `threshold` on battery that come back above it before AC returns: alarms a real empty pack
+    # never raises. With confirm > 1 a dip only counts once it lasts that many consecutive samples
+    import numpy as np
+    below = (np.asarray(values) < threshold) & (np.asarray(pld) != 1)
+    edges = np.diff(np.concatenate([[0], below.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    recovered = ends < len(below)
+    recovered[recovered] &= np.asarray(pld)[ends[recovered]] != 1 # came back above on battery, not by AC
+    return int(np.sum(recovered & (ends - starts >= confirm)))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: filters.py trace.csv|history.bin|--synthetic [threshold]")
+        sys.exit(1)
+    import numpy as np
+    import replay
+    if sys.argv[1] == "--synthetic": # noisy discharge with 10 s load bursts and the sag they cause
+        trace = replay.synthetic(noise=0.005)
+        rng = np.random.default_rng(1)
+        bursts = (rng.random(len(trace.time)) < 0.005) * rng.uniform(0, 10, len(trace.time))
+        spikes = np.convolve(bursts, np.ones(10))[:len(trace.time)] * (trace.pld != 1)
+        trace = trace._replace(watts=trace.watts + spikes, voltage=trace.voltage - RESISTANCE * spikes / EFFICIENCY / trace.voltage)
+        traces = [trace]
+    else:
+        traces = [replay.load(path) for path in sys.argv[1].split(",")]
+    threshold = float(sys.argv[2]) if len(sys.argv) > 2 else THRESHOLD
+    for trace in traces:
+        voltage, _ = filter_arrays(trace.time, trace.voltage, trace.capacity, trace.watts, trace.pld)
+        plain, _ = filter_arrays(trace.time, trace.voltage, trace.capacity)
+        hours = (trace.time[-1] - trace.time[0]) / 3600
+        print(f"{trace.name}: {len(trace.time)} samples over {hours:.1f} h, false crossings of {threshold:.2f} V")
+        for name, values in (("raw", trace.voltage), ("filtered", plain), ("load compensated", voltage)):
+            counts = [false_triggers(trace.time, values, trace.pld, threshold, confirm) for confirm in (1, 3)]
+            print(f"  {name:<17} {counts[0]:>6} single samples {counts[1]:>6} 3 in a row")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Fuel gauge (0x36, MAX17048-style) driver shared by the X120x scripts
+# VCELL (0x02) and SOC (0x04) are contiguous, so both come back in one block read
+# the chip also measures its own charge rate (CRATE) and latches empty-SOC and low-voltage alerts
+# (STATUS) between our reads, so a caller that configures the alerts can sample much less often
+
+import struct
+
+GAUGE_ADDRESS = 0x36 # i2cdetect -y 1
+VCELL_REG = 0x02 # VCELL 0x02-0x03, SOC 0x04-0x05
+VCELL_SOC = struct.Struct(">HH") # registers are big endian on the wire
+CONFIG_REG = 0x0C # RCOMP, then SLEEP | ALSC | ALRT | ATHD (empty alert at 32 - ATHD %)
+VALRT_REG = 0x14 # voltage alert window: MIN, MAX in 20 mV steps
+CRATE_REG = 0x16 # CRATE 0x16-0x17, VRESET/ID 0x18-0x19, STATUS 0x1A-0x1B
+RATE_STATUS = struct.Struct(">hHH")
+WORD = struct.Struct(">H")
+
+CONFIG_ALRT = 0x0020 # set with any alert, holds the ALRT pin low until cleared
+CONFIG_ATHD = 0x001F
+CRATE_LSB = 0.208 # %/hour
+VALRT_LSB = 0.02 # V
+ALERTS = { # STATUS high byte flags
+    0x01: "reset", # RI: the chip was reset and lost its configuration
+    0x02: "voltage_high", # VH
+    0x04: "voltage_low", # VL
+    0x08: "voltage_reset", # VR
+    0x10: "soc_low", # HD: SOC crossed the empty threshold
+    0x20: "soc_change", # SC: 1% SOC change, only if ALSC is set
+}
+
+class FuelGauge:
+    def __init__(self, bus, address=GAUGE_ADDRESS):
+        self.bus = bus
+        self.address = address
+        self.voltage = None # last sample, served to every consumer in the tick
+        self.capacity = None
+        self.rate = None # %/hour from CRATE, negative while discharging
+        self.thresholds = None # (empty SOC, min voltage) the alerts were configured with
+
+    def refresh(self): # one bus transaction per tick
+        data = self.bus.read_i2c_block_data(self.address, VCELL_REG, VCELL_SOC.size)
+        vcell, soc = VCELL_SOC.unpack(bytes(data))
+        self.voltage = vcell * 1.25 / 1000 / 16 # convert to understandable voltage
+        self.capacity = soc / 256 # convert to 1-100% scale
+        return self.voltage, self.capacity
+
+    def read_word(self, reg):
+        return WORD.unpack(bytes(self.bus.read_i2c_block_data(self.address, reg, 2)))[0]
+
+    def write_word(self, reg, value):
+        self.bus.write_i2c_block_data(self.address, reg, list(WORD.pack(value)))
+
+    def configure_alerts(self, empty_soc, min_voltage): # from the shutdown thresholds; STATUS is cleared too
+        athd = 32 - min(32, max(1, round(empty_soc)))
+        config = self.read_word(CONFIG_REG)
+        self.write_word(CONFIG_REG, config & ~(CONFIG_ALRT | CONFIG_ATHD) | athd)
+        self.write_word(VALRT_REG, min(255, round(min_voltage / VALRT_LSB)) << 8 | 0xFF) # no high voltage alert
+        self.write_word(CRATE_REG + 4, 0)
+        self.thresholds = (empty_soc, min_voltage)
+
+    def poll(self): # voltage, capacity, rate and the alerts raised since the last poll, in two reads
+        voltage, capacity = self.refresh()
+        crate, _, status = RATE_STATUS.unpack(bytes(self.bus.read_i2c_block_data(self.address, CRATE_REG, RATE_STATUS.size)))
+        self.rate = crate * CRATE_LSB
+        flags = status >> 8
+        alerts = {name for bit, name in ALERTS.items() if flags & bit}
+        if flags & 0x3F: # acknowledge, which also releases the ALRT pin
+            self.write_word(CRATE_REG + 4, status & 0xC0FF)
+            self.write_word(CONFIG_REG, self.read_word(CONFIG_REG) & ~CONFIG_ALRT)
+            if "reset" in alerts and self.thresholds is not None: # a reset lost the thresholds
+                self.configure_alerts(*self.thresholds)
+        return voltage, capacity, self.rate, alerts
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# On-disk battery history: a memory-mapped ring of fixed 32 byte records
+# appends are a slot write plus a header store, no fsync; the kernel writes the pages back lazily
+# each record carries its own sequence number, so a power cut that loses the header update
+# or a record page is repaired on the next open instead of corrupting the ring
+
+import mmap
+import os
+import struct
+import sys
+
+HISTORY_PATH = "/var/lib/x120x/history.bin"
+DEFAULT_RECORDS = 92 * 24 * 3600 # three months at 1 Hz, ~250 MB
+
+MAGIC = b"X120XHST"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQ") # magic, version, record size, capacity, records written
+HEADER_SIZE = 64 # records start on a 64 byte boundary and never straddle a page
+HEAD_OFFSET = 24 # offset of "records written" in the header
+HEAD = struct.Struct("<Q")
+RECORD = struct.Struct("<dIffffeBx") # time, seq, VCELL, SOC, EXT5V, watts, temp, PLD
+SEQ_MASK = 0xFFFFFFFF
+
+RECORD_DTYPE = [ # numpy dtype matching RECORD, for zero-copy views
+    ("time", "<f8"),
+    ("seq", "<u4"),
+    ("voltage", "<f4"),
+    ("capacity", "<f4"),
+    ("input_voltage", "<f4"),
+    ("watts", "<f4"),
+    ("cpu_temp", "<f2"),
+    ("pld", "u1"),
+    ("pad", "u1"),
+]
+
+def _value(sample, key, fallback=None):
+    value = sample.get(key, sample.get(fallback))
+    return float("nan") if value is None else value
+
+class History:
+    def __init__(self, path=HISTORY_PATH, records=DEFAULT_RECORDS, writable=True):
+        self.path = path
+        self.writable = writable
+        if writable:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        else:
+            fd = os.open(path, os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            if size == 0 and writable: # new file, sparse until written
+                os.ftruncate(fd, HEADER_SIZE + records * RECORD.size)
+                os.pwrite(fd, HEADER.pack(MAGIC, VERSION, RECORD.size, records, 0), 0)
+            self.mm = mmap.mmap(fd, 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        finally:
+            os.close(fd) # the mapping keeps the file open
+        magic, version, record_size, self.capacity, head = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.mm.close()
+            raise ValueError(f"{path} is not an X120x history file")
+        self.head = self._recover(head)
+        if writable and self.head != head:
+            HEAD.pack_into(self.mm, HEAD_OFFSET, self.head)
+
+    def _seq(self, index):
+        return struct.unpack_from("<I", self.mm, HEADER_SIZE + (index % self.capacity) * RECORD.size + 8)[0]
+
+    def _recover(self, head): # trust the records' sequence numbers over the header
+        for _ in range(self.capacity): # header behind the records
+            if self._seq(head) != (head + 1) & SEQ_MASK:
+                break
+            head += 1
+        for _ in range(self.capacity): # header ahead of the records
+            if head == 0 or self._seq(head - 1) == head & SEQ_MASK:
+                break
+            head -= 1
+        return head
+
+    def __len__(self):
+        return min(self.head, self.capacity)
+
+    def append(self, sample): # O(1): one record, then the head
+        offset = HEADER_SIZE + (self.head % self.capacity) * RECORD.size
+        RECORD.pack_into(self.mm, offset,
+                         sample.get("time") or 0.0,
+                         (self.head + 1) & SEQ_MASK,
+                         _value(sample, "raw_voltage", "voltage"), # unfiltered, so filters.py can replay it
+                         _value(sample, "raw_capacity", "capacity"),
+                         _value(sample, "input_voltage"),
+                         _value(sample, "watts"),
+                         _value(sample, "cpu_temp"),
+                         sample.get("pld") or 0)
+        self.head += 1
+        HEAD.pack_into(self.mm, HEAD_OFFSET, self.head)
+
+    def refresh(self): # readers: pick up records appended by the writer
+        self.head = HEAD.unpack_from(self.mm, HEAD_OFFSET)[0]
+        return self.head
+
+    def arrays(self): # zero-copy numpy views in chronological order (two when the ring has wrapped)
+        import numpy as np
+        ring = np.frombuffer(self.mm, dtype=np.dtype(RECORD_DTYPE), count=self.capacity, offset=HEADER_SIZE)
+        start = self.head % self.capacity
+        if self.head <= self.capacity:
+            return [ring[:self.head]]
+        return [ring[start:], ring[:start]]
+
+    def tail(self, count): # last `count` records as one array; copies only if they wrap around the end
+        import numpy as np
+        count = min(count, len(self))
+        parts = self.arrays()
+        newest = parts[-1][len(parts[-1]) - min(count, len(parts[-1])):]
+        if len(newest) == count:
+            return newest
+        older = parts[0][len(parts[0]) - (count - len(newest)):]
+        return np.concatenate([older, newest])
+
+    def flush(self):
+        self.mm.flush() # msync, only on close or on demand
+
+    def close(self):
+        if not self.mm.closed:
+            if self.writable:
+                self.mm.flush()
+            self.mm.close()
+
+if __name__ == "__main__": # dump the last records: history.py [count] [path]
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    history = History(sys.argv[2] if len(sys.argv) > 2 else HISTORY_PATH, writable=False)
+    for record in history.tail(count).tolist():
+        time_, _, voltage, capacity, input_voltage, watts, cpu_temp, pld, _ = record
+        print(f"{time_:.0f} Voltage: {voltage:.3f}V Battery: {capacity:.2f}% Input: {input_voltage:.3f}V Watts: {watts:.3f}W Temp: {cpu_temp:.1f}C PLD: {pld}")
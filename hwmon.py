@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# sysfs metrics for the Pi 5: fan RPM (cooling_fan hwmon) and CPU temperature (thermal_zone0)
+# nodes are looked up once and kept open; every read is a single pread at offset 0
+# the hwmon index can change when the fan driver is reloaded, so a failed read or a vanished
+# node triggers a fresh lookup; a node that isn't there (no fan fitted) is looked for again every RECHECK reads
+
+import os
+from pathlib import Path
+from sensors import read_cpu_temp
+
+SYSFS = os.environ.get("X120X_SYSFS", "/sys") # another tree for testing, e.g. the one fakes.py writes
+RECHECK = 60 # reads between checks that an open node still exists, or that a missing one has appeared
+
+class SysfsValue:
+    def __init__(self, find):
+        self.find = find # returns the node's path, or None when it doesn't exist
+        self.path = None
+        self.fd = None
+        self.reads = 0
+        self.lookups = 0
+
+    def open(self):
+        self.close()
+        self.lookups += 1
+        self.path = self.find()
+        if self.path is None:
+            return False
+        try:
+            self.fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            self.path = None
+            return False
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def read(self): # integer value of the node, None if it can't be found
+        self.reads += 1
+        if self.fd is None and self.lookups and self.reads % RECHECK: # the last lookup failed, don't rglob every tick
+            return None
+        if self.fd is None or (self.reads % RECHECK == 0 and not os.path.exists(self.path)):
+            if not self.open():
+                return None
+        try:
+            return int(os.pread(self.fd, 32, 0))
+        except (OSError, ValueError): # driver gone or reloaded under us, look it up again
+            if not self.open():
+                return None
+        try:
+            return int(os.pread(self.fd, 32, 0))
+        except (OSError, ValueError):
+            return None
+
+def _first(paths):
+    return next((str(path) for path in paths), None)
+
+class SysfsMetrics:
+    def __init__(self, sysfs=None):
+        sysfs = sysfs or SYSFS
+        fan_root = Path(sysfs, "devices/platform/cooling_fan")
+        thermal = Path(sysfs, "class/thermal/thermal_zone0/temp")
+        self.fan = SysfsValue(lambda: _first(fan_root.rglob("fan1_input"))) # sometimes its under hwmon2, sometimes hwmon3...
+        self.thermal = SysfsValue(lambda: str(thermal) if thermal.exists() else None)
+
+    def fan_rpm(self):
+        return self.fan.read()
+
+    def cpu_temp(self): # degrees C
+        millidegrees = self.thermal.read()
+        if millidegrees is None:
+            return read_cpu_temp() # no thermal zone, ask vcgencmd
+        return millidegrees / 1000
+
+    def close(self):
+        self.fan.close()
+        self.thermal.close()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# Latency histograms and error counts for every sensor read and for the whole tick
+# off unless X120X_INSTRUMENT=1: wrap() then returns the function untouched, so there is no cost at all
+# dump a running process with `kill -USR1 <pid>` (to stderr), or ask the daemon with `x120xd.py stats`
+
+import os
+import signal
+import sys
+import time
+
+enabled = os.environ.get("X120X_INSTRUMENT") == "1"
+BUCKETS = 128 # 4 log-linear buckets per power of two microseconds, ~25% resolution up to ~1 hour
+
+class Histogram:
+    __slots__ = ("buckets", "count", "errors", "total", "max")
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds): # O(1), no allocation
+        us = int(seconds * 1e6)
+        bits = us.bit_length()
+        index = us if bits < 3 else 4 * (bits - 2) + (us >> (bits - 3) & 3)
+        self.buckets[min(index, BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p): # upper edge of the bucket holding the p-th percentile, in seconds
+        if not self.count:
+            return None
+        rank = self.count * p / 100
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                break
+        if index < 4:
+            upper = index + 1
+        else:
+            upper = (5 + index % 4) << (index // 4 - 1)
+        return min(upper / 1e6, self.max)
+
+stats = {} # name -> Histogram
+
+def histogram(name):
+    return stats.setdefault(name, Histogram())
+
+def wrap(name, fn, failed=None): # failed(result) -> True counts a returned value as an error
+    if not enabled:
+        return fn
+    hist = histogram(name)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            hist.errors += 1
+            raise
+        finally:
+            hist.record(time.perf_counter() - start)
+        if failed is not None and failed(result):
+            hist.errors += 1
+        return result
+    return timed
+
+def error(name): # errors seen outside the wrapped call, e.g. a sensor that missed its deadline
+    if enabled:
+        histogram(name).errors += 1
+
+def report():
+    return {
+        name: {
+            "count": hist.count,
+            "errors": hist.errors,
+            "mean_ms": hist.total / hist.count * 1000 if hist.count else None,
+            "p50_ms": hist.percentile(50) * 1000 if hist.count else None,
+            "p99_ms": hist.percentile(99) * 1000 if hist.count else None,
+            "max_ms": hist.max * 1000 if hist.count else None,
+        }
+        for name, hist in sorted(stats.items())
+    }
+
+def format_report(data=None):
+    data = report() if data is None else data
+    if not data:
+        return "No instrumentation data (set X120X_INSTRUMENT=1)"
+    lines = [f"{'sensor':<12}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for name, row in data.items():
+        if not row["count"]:
+            lines.append(f"{name:<12}{0:>8}{row['errors']:>8}{'-':>10}{'-':>10}{'-':>10}")
+            continue
+        lines.append(f"{name:<12}{row['count']:>8}{row['errors']:>8}{row['p50_ms']:>10.3f}{row['p99_ms']:>10.3f}{row['max_ms']:>10.3f}")
+    return "\n".join(lines)
+
+def install_signal_handler(stream=sys.stderr):
+    signal.signal(signal.SIGUSR1, lambda signum, frame: print(format_report(), file=stream, flush=True))
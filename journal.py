@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# Durable event journal: power transitions, threshold crossings, shutdown/cancel actions, sensor errors
+# one JSON object per line; entries are buffered in memory and written in one large append every
+# FLUSH_INTERVAL seconds, so the SD card sees a few writes an hour instead of one per event.
+# urgent entries (power loss, shutdown) are written and fsynced at once so they survive the power cut
+# several scripts append to the same file: each flush holds an flock on it, and a writer whose file was rotated
+# by another process reopens the new one instead of rotating again
+# usage: journal.py [path]: print the journal
+
+import fcntl
+import json
+import os
+import sys
+import time
+
+JOURNAL_PATH = os.environ.get("X120X_JOURNAL", "/var/lib/x120x/events.jsonl") # fakes.py points it at a temp dir
+FLUSH_INTERVAL = 600 # seconds between routine appends
+FLUSH_BYTES = 64 * 1024 # or as soon as this much is buffered
+MAX_SIZE = 4 * 1024 * 1024 # rotated to <path>.1 past this size
+
+class Journal:
+    def __init__(self, source, path=JOURNAL_PATH, interval=FLUSH_INTERVAL, clock=time.monotonic):
+        self.source = source # which script wrote the entry
+        self.path = path
+        self.interval = interval
+        self.clock = clock
+        self.buffer = []
+        self.buffered = 0 # bytes
+        self.due = clock() + interval
+        self.writes = 0 # counters for the write-amplification benchmark and the daemon stats
+        self.bytes = 0
+        self.fsyncs = 0
+        self.fd = self._open()
+
+    def _open(self): # None if the journal can't be written, e.g. a front-end not running as root
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            return os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        except OSError:
+            return None
+
+    def record(self, event, urgent=False, **fields):
+        line = json.dumps({"time": round(time.time(), 3), "source": self.source, "event": event, **fields}, separators=(",", ":")) + "\n"
+        self.buffer.append(line)
+        self.buffered += len(line)
+        if urgent:
+            self.flush(sync=True)
+        elif self.buffered >= FLUSH_BYTES:
+            self.flush()
+
+    def tick(self): # call from the owner's loop; writes the buffer once the interval is up
+        if self.clock() >= self.due:
+            self.flush()
+
+    def flush(self, sync=False):
+        self.due = self.clock() + self.interval
+        if self.fd is None:
+            self.buffer.clear()
+            self.buffered = 0
+            return
+        if not self.buffer and not sync:
+            return
+        data = "".join(self.buffer).encode()
+        self.buffer.clear()
+        self.buffered = 0
+        if not self._lock():
+            return
+        try:
+            if data:
+                os.write(self.fd, data) # O_APPEND, one syscall per batch
+                self.writes += 1
+                self.bytes += len(data)
+            if sync:
+                os.fsync(self.fd)
+                self.fsyncs += 1
+            if os.fstat(self.fd).st_size > MAX_SIZE:
+                os.replace(self.path, self.path + ".1") # under the lock, so only one writer rotates
+        except OSError as e:
+            print(f"Error writing {self.path}: {e}")
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _lock(self): # locks the file at self.path, reopening it if another process rotated ours; False if it can't be written
+        while self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            mine = os.fstat(self.fd)
+            try:
+                current = os.stat(self.path)
+                if (current.st_dev, current.st_ino) == (mine.st_dev, mine.st_ino):
+                    return True
+            except FileNotFoundError: # renamed and not created again yet
+                pass
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = self._open()
+        return False
+
+    def close(self):
+        self.flush(sync=True)
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+def read(path=JOURNAL_PATH): # entries from the rotated file first, oldest to newest
+    for name in (path + ".1", path):
+        try:
+            with open(name) as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError: # torn last line after a power cut
+                        continue
+        except FileNotFoundError:
+            continue
+
+if __name__ == "__main__":
+    for entry in read(sys.argv[1] if len(sys.argv) > 1 else JOURNAL_PATH):
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.pop("time")))
+        source, event = entry.pop("source"), entry.pop("event")
+        print(f"{stamp} {source}: {event} " + " ".join(f"{key}={value}" for key, value in entry.items()))
@@ -1,30 +1,25 @@
 #!/usr/bin/python3
+# Shutdown watchdog; with Loop = False it is meant to be run often (cron, a systemd timer)
+# so a run on AC costs one GPIO read: the I2C, scheduler and shutdown modules are only imported on battery
+# while x120xd.py runs it owns GPIO 6 and the gauge, so the samples come from its socket instead (the PLD state,
+# the filtered voltage and capacity, the gauge alerts); the hardware is only read directly without the daemon,
+# and the gauge alone when the daemon's gauge readings stop (GPIO 6 stays with the daemon)
+# a confirmed critical condition runs the pre-shutdown hooks (shutdown.py) inside a budget from the runtime left
 
+import fcntl
 import os
-import struct
-import smbus2
+import sys
 import time
-import logging
-import subprocess
-import gpiod
-from subprocess import call
+from collections import namedtuple
 
 # User-configurable variables
-SHUTDOWN_THRESHOLD = 3  # Number of consecutive failures required for shutdown
-SLEEP_TIME = 60  # Time in seconds to wait between failure checks
+SHUTDOWN_THRESHOLD = 3  # Number of consecutive critical samples required for shutdown
+AC_LOSS_SHUTDOWN = 120  # Seconds on battery before shutting down even if nothing is critical, None to never
+MIN_RUNTIME = 5  # Predicted minutes of battery left (lower bound) that count as critical
 Loop =  False
-
-def readVoltage(bus):
-    read = bus.read_word_data(address, 2) # reads word data (16 bit)
-    swapped = struct.unpack("<H", struct.pack(">H", read))[0] # big endian to little endian
-    voltage = swapped * 1.25 / 1000 / 16 # convert to understandable voltage
-    return voltage
-
-def readCapacity(bus):
-    read = bus.read_word_data(address, 4) # reads word data (16 bit)
-    swapped = struct.unpack("<H", struct.pack(">H", read))[0] # big endian to little endian
-    capacity = swapped / 256 # convert to 1-100% scale
-    return capacity
+LOCKFILE = "/var/run/X1200.pid" # move to /var/run because of conventions
+REPLY_TIMEOUT = 10 # seconds to wait for a sample from x120xd.py before reading the hardware ourselves
+GAUGE_RETRIES = 3 # fresh samples asked of x120xd.py without a gauge reading before reading the gauge ourselves
 
 def get_battery_status(voltage):
     if 3.87 <= voltage <= 4.2:
@@ -40,70 +35,205 @@ def get_battery_status(voltage):
     else:
         return "Unknown"
 
-# Ensure only one instance of the script is running
-pid = str(os.getpid())
-pidfile = "/var/run/X1200.pid" # move to /var/run because of conventions
-if os.path.isfile(pidfile):
-    print("Script already running")
-    exit(1)
-else:
-    with open(pidfile, 'w') as f:
-        f.write(pid)
-
-try:
-    bus = smbus2.SMBus(1)
-    address = 0x36
-    PLD_PIN = 6
-    chip = gpiod.Chip('gpiochip0') # since kernel release 6.6.45 you have to use 'gpiochip0' - before it was 'gpiochip4'
-    pld_line = chip.get_line(PLD_PIN)
-    pld_line.request(consumer="PLD", type=gpiod.LINE_REQ_DIR_IN)
-
-    while True:
-        failure_counter = 0
-
-        for _ in range(SHUTDOWN_THRESHOLD):
-            ac_power_state = pld_line.get_value()
-            voltage = readVoltage(bus)
-            battery_status = get_battery_status(voltage)
-            capacity = readCapacity(bus)
-            print(f"Capacity: {capacity:.2f}% ({battery_status}), AC Power State: {'Plugged in' if ac_power_state == 1 else 'Unplugged'}, Voltage: {voltage:.2f}V")
-            if ac_power_state == 0:
-                print("UPS is unplugged or AC power loss detected.")
-                failure_counter += 1
-                if capacity < 20:
-                    print("Battery level critical.")
-                    failure_counter += 1
-                if voltage < 3.20:
-                    print("Battery voltage critical.")
-                    failure_counter += 1
-            else:
-                failure_counter = 0
+def acquire_lock(path=LOCKFILE): # fd holding the lock, None if another instance has it
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB) # dropped by the kernel when we exit, even after a crash
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    os.ftruncate(fd, 0)
+    os.write(fd, f"{os.getpid()}\n".encode())
+    return fd
+
+Reading = namedtuple("Reading", "pld voltage capacity raw_voltage rate alerts") # one sample, filtered
+
+class DaemonSource:
+    # samples from x120xd.py, which owns GPIO 6 and the gauge while it runs; they come filtered (with the load
+    # compensation merged.py can't do without the PMIC) and carry the gauge alerts the daemon armed
+    owns_pld = False # x120xd.py journals the PLD edges itself
+
+    def __init__(self, subscription):
+        self.subscription = subscription
+        self.sample = None # latest one, the PLD state is good with or without a gauge reading
+        self.alerts = set() # raised since the last read()
+        self.gauge = None # DirectGauge once the daemon's gauge readings stopped coming
+        self.take(subscription.next(REPLY_TIMEOUT)) # the latest sample comes on connect
+
+    def take(self, sample):
+        if sample is None:
+            raise ConnectionError("x120xd.py sent no sample")
+        if "pld" not in sample: # a stats reply
+            return
+        self.alerts.update(sample.get("alerts") or ())
+        self.sample = sample
+
+    def has_gauge(self): # the latest sample carries a fresh gauge reading
+        sample = self.sample
+        return sample["voltage"] is not None and sample["capacity"] is not None and "gauge" not in sample.get("stale", ())
+
+    def pld(self):
+        return self.sample["pld"]
+
+    def read(self):
+        for _ in range(GAUGE_RETRIES):
+            if self.has_gauge():
                 break
+            self.subscription.request()
+            self.take(self.subscription.next(REPLY_TIMEOUT))
+        sample = self.sample
+        if not self.has_gauge(): # the daemon's gauge is failing: read it ourselves, GPIO 6 stays with the daemon
+            if self.gauge is None:
+                from scheduler import CRITICAL_CAPACITY, CRITICAL_VOLTAGE
+                self.gauge = DirectGauge(CRITICAL_CAPACITY, CRITICAL_VOLTAGE) # the thresholds the daemon arms
+            return Reading(sample["pld"], *self.gauge.read())
+        alerts = self.alerts if "alerts" in sample else None # an older daemon without the alerts
+        self.alerts = set()
+        return Reading(sample["pld"], sample["voltage"], sample["capacity"], sample["raw_voltage"], sample.get("charge_rate"), alerts)
+
+    def wait(self, interval): # early on a PLD edge, which the daemon publishes at once; then a fresh sample
+        pld = self.sample["pld"]
+        deadline = time.monotonic() + interval
+        while True:
+            sample = self.subscription.next(max(0.0, deadline - time.monotonic()))
+            if sample is None:
+                break
+            self.take(sample)
+            if self.sample["pld"] != pld:
+                return self.sample["pld"]
+        self.subscription.request()
+        self.take(self.subscription.next(REPLY_TIMEOUT))
+        return None
+
+    def close(self):
+        self.subscription.close()
+
+class DirectGauge:
+    # the fuel gauge straight over I2C, without the daemon's PMIC, so smoothing only, no load compensation
+    def __init__(self, critical_capacity, critical_voltage):
+        import smbus2
+        from gauge import FuelGauge
+        from filters import BatteryFilter
+        self.gauge = FuelGauge(smbus2.SMBus(1))
+        self.gauge.configure_alerts(critical_capacity, critical_voltage) # the chip latches the crossings between our samples
+        self.battery = BatteryFilter()
+
+    def read(self): # (voltage, capacity, raw_voltage, rate, alerts), the rest of a Reading
+        raw_voltage, raw_capacity, rate, alerts = self.gauge.poll() # VCELL + SOC, then CRATE + STATUS
+        voltage, capacity = self.battery.update(time.monotonic(), raw_voltage, raw_capacity)[:2] # one sagging sample doesn't count as critical
+        return voltage, capacity, raw_voltage, rate, alerts
+
+class HardwareSource:
+    # GPIO 6 and the gauge straight from the hardware, when no daemon runs
+    owns_pld = True
+
+    def __init__(self, pld_line, scheduler):
+        from pld import PldEdgeSource, PldWatcher
+        self.pld_line = pld_line
+        self.gauge = DirectGauge(scheduler.critical_capacity, scheduler.critical_voltage)
+        self.watcher = PldWatcher(PldEdgeSource(pld_line))
+
+    def read(self):
+        return Reading(self.pld_line.get_value(), *self.gauge.read())
+
+    def wait(self, interval): # sampling rate follows the state, a PLD edge wakes us early
+        return self.watcher.wait(interval)
+
+    def close(self):
+        self.pld_line.release()
+
+class Watchdog:
+    # one sample through the scheduler, with the console output and the journal entries, whatever its source
+    def __init__(self, journal=None, predict=None):
+        from scheduler import AdaptiveScheduler
+        self.scheduler = AdaptiveScheduler(confirm=SHUTDOWN_THRESHOLD, ac_loss_shutdown=AC_LOSS_SHUTDOWN, min_runtime=MIN_RUNTIME)
+        self.journal = journal
+        self.predict = predict # minutes of battery left, None if unknown
+        self.runtime = None
+        self.last_state = None
+
+    def step(self, reading, now=None):
+        now = time.monotonic() if now is None else now
+        ac_power_state, voltage, capacity = reading.pld, reading.voltage, reading.capacity
+        battery_status = get_battery_status(voltage)
+        print(f"Capacity: {capacity:.2f}% ({battery_status}), AC Power State: {'Plugged in' if ac_power_state == 1 else 'Unplugged'}, Voltage: {voltage:.2f}V (raw {reading.raw_voltage:.2f}V)")
+        self.runtime = self.predict() if ac_power_state == 0 and self.predict is not None else None
+        decision = self.scheduler.update(now, ac_power_state, voltage, capacity, self.runtime, reading.alerts, reading.rate)
+        journal = self.journal
+        if reading.alerts and journal is not None:
+            journal.record("gauge_alert", alerts=sorted(reading.alerts), capacity=capacity, voltage=voltage, rate=reading.rate)
+        if ac_power_state == 0:
+            print("UPS is unplugged or AC power loss detected.")
+            for reason in decision.reasons:
+                print(f"{reason.capitalize()}.")
+        if decision.state != self.last_state: # ac/ac_full/battery/critical: power transitions and threshold crossings
+            if journal is not None:
+                journal.record("state", urgent=self.last_state is None and ac_power_state == 0, # the outage that started this run
+                               state=decision.state, reasons=decision.reasons, capacity=capacity, voltage=voltage, runtime=self.runtime)
+            self.last_state = decision.state
+        if decision.shutdown:
+            print(f"Critical condition met due to {decision.reasons[0]}. Initiating shutdown.")
+            if journal is not None:
+                journal.record("shutdown", urgent=True, reason=decision.reasons[0], capacity=capacity, voltage=voltage)
+        return decision
+
+def daemon_source(): # None if x120xd.py isn't running
+    from client import connect, Subscription
+    sock = connect()
+    if sock is None:
+        return None
+    try:
+        return DaemonSource(Subscription(sock))
+    except (ConnectionError, OSError, ValueError):
+        sock.close()
+        return None
+
+def main():
+    # Ensure only one instance of the script is running
+    if acquire_lock() is None:
+        print("Script already running")
+        return 1
+
+    source = daemon_source() # x120xd.py holds GPIO 6, requesting it again would fail with EBUSY
+    if source is None:
+        from pld import request_pld_line
+        pld_line = request_pld_line() # edge events on GPIO 6
+        if pld_line.get_value() == 1 and not Loop:
+            pld_line.release()
+            return 0 # nothing to do on AC, and the fuel gauge was never touched
+    elif source.pld() == 1 and not Loop:
+        source.close()
+        return 0
 
-            if failure_counter < SHUTDOWN_THRESHOLD:
-                time.sleep(SLEEP_TIME) 
-
-        if failure_counter >= SHUTDOWN_THRESHOLD:
-            shutdown_reason = ""
-            if capacity < 20:
-                shutdown_reason = "due to critical battery level."
-            elif voltage < 3.20:
-                shutdown_reason = "due to critical battery voltage."
-            elif ac_power_state == 0:
-                shutdown_reason = "due to AC power loss or UPS unplugged."
-
-            shutdown_message = f"Critical condition met {shutdown_reason} Initiating shutdown."
-            print(shutdown_message)
-            call("sudo nohup shutdown -h now", shell=True)
-        else:
-            #print("System operating within normal parameters. No action required.")
-            if Loop:
-                time.sleep(SLEEP_TIME)
-            else:
-                exit(0)
-
-finally:
-    if os.path.isfile(pidfile):
-        os.unlink(pidfile)
-    exit(0)
+    from journal import Journal
+    from shutdown import orchestrate, predicted_runtime
+    journal = Journal("merged.py")
+    watchdog = Watchdog(journal, predicted_runtime)
+    if source is None:
+        source = HardwareSource(pld_line, watchdog.scheduler)
+    try:
+        while True:
+            try:
+                reading = source.read()
+                decision = watchdog.step(reading)
+                if decision.shutdown:
+                    orchestrate(decision.reasons[0], watchdog.runtime, journal) # hooks in parallel, then shutdown -h now
+                    return 0
+                elif reading.pld == 1 and not Loop:
+                    #print("System operating within normal parameters. No action required.")
+                    return 0
+                journal.tick()
+                if source.wait(decision.interval) == 0 and source.owns_pld:
+                    journal.record("power_lost", urgent=True, capacity=reading.capacity, voltage=reading.voltage)
+            except ConnectionError as e: # the daemon stopped: GPIO 6 is free again, carry on with the same scheduler
+                print(f"Lost x120xd.py ({e}), reading the hardware directly.")
+                journal.record("daemon_lost", urgent=True)
+                source.close()
+                from pld import request_pld_line
+                source = HardwareSource(request_pld_line(), watchdog.scheduler)
+    finally:
+        journal.close()
+        source.close()
 
+if __name__ == "__main__":
+    sys.exit(main())
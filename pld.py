@@ -2,24 +2,71 @@
 #This python script is only suitable for UPS Shield X1200, X1201 and X1202
 
 import gpiod
+import select
+import sys
 import time
-from subprocess import call
 
 PLD_PIN = 6
-chip = gpiod.Chip('gpiochip0') # since kernel release 6.6.45 you have to use 'gpiochip0' - before it was 'gpiochip4'
-pld_line = chip.get_line(PLD_PIN)
-pld_line.request(consumer="PLD", type=gpiod.LINE_REQ_DIR_IN)
-try:
-   while True:
-       pld_state = pld_line.get_value()
-       if pld_state == 1:
-            print ("---AC Power OK,Power Adapter OK---")
-            time.sleep(1)
-       else:
-            print ("---AC Power Loss OR Power Adapter Failure---")
-            time.sleep(1)
-            #call("sudo nohup shutdown -h now", shell=True)  #uncomment to implement shutdown when power outage
-
-finally:
-
- pld_line.release()
+
+def request_pld_line(edges=True):
+    chip = gpiod.Chip('gpiochip0') # since kernel release 6.6.45 you have to use 'gpiochip0' - before it was 'gpiochip4'
+    line = chip.get_line(PLD_PIN)
+    if edges:
+        line.request(consumer="PLD", type=gpiod.LINE_REQ_EV_BOTH_EDGES) # kernel queues an event on every AC transition
+    else:
+        line.request(consumer="PLD", type=gpiod.LINE_REQ_DIR_IN)
+    return line
+
+class PldEdgeSource:
+    # gpiod line requested for edge events; anything with fileno/get_value/read_event can stand in for it
+    def __init__(self, line):
+        self.line = line
+
+    def fileno(self):
+        return self.line.event_get_fd()
+
+    def get_value(self):
+        return self.line.get_value()
+
+    def read_event(self):
+        event = self.line.event_read()
+        return 1 if event.type == gpiod.LineEvent.RISING_EDGE else 0 # rising = AC back, falling = power loss
+
+class PldWatcher:
+    def __init__(self, source):
+        self.source = source
+        self.poller = select.poll()
+        self.poller.register(source.fileno(), select.POLLIN | select.POLLPRI)
+        self.state = source.get_value()
+
+    def wait(self, timeout=None): # blocks on the line's fd, returns the new PLD state or None on timeout
+        if not self.poller.poll(None if timeout is None else timeout * 1000):
+            return None
+        self.state = self.source.read_event()
+        while self.poller.poll(0): # drain contact bounce, keep the last edge
+            self.state = self.source.read_event()
+        return self.state
+
+def report(pld_state):
+    if pld_state == 1:
+        print ("---AC Power OK,Power Adapter OK---")
+    else:
+        print ("---AC Power Loss OR Power Adapter Failure---")
+        #from subprocess import call  #uncomment both lines to implement shutdown when power outage
+        #call("sudo nohup shutdown -h now", shell=True)
+
+if __name__ == "__main__":
+    polling = "--poll" in sys.argv # old 1 s polling loop
+    pld_line = request_pld_line(edges=not polling)
+    try:
+        if polling:
+            while True:
+                report(pld_line.get_value())
+                time.sleep(1)
+        else:
+            watcher = PldWatcher(PldEdgeSource(pld_line))
+            report(watcher.state)
+            while True:
+                report(watcher.wait()) # no CPU used until the line changes
+    finally:
+        pld_line.release()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# Battery warnings and the delayed shutdown used by the status front-ends (qtx120x.py, qtx120xTerminal.py)
+# update() only decides; the caller prints the warning and runs the returned action,
+# so the same rules run unchanged in replay.py on a simulated clock
+# the delayed shutdown goes through shutdown.py, which runs the pre-shutdown hooks and may power off
+# sooner than DELAY if the pack won't last that long
+
+import os
+import shlex
+import sys
+from collections import namedtuple
+
+BACKUP = 51 # % and above: running on backup power
+APPROACHING = 25 # % and above: approaching critical
+SHUTDOWN = 15 # % and below: schedule the delayed shutdown, critical in between
+DELAY = 5 # minutes between scheduling the shutdown and the power off
+
+SHUTDOWN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shutdown.py")
+COMMANDS = {
+    "schedule": "sudo nohup {python} {script} --delay {delay} 'Power failure' >/dev/null 2>&1 &",
+    "cancel": "sudo {python} {script} --cancel",
+}
+
+Verdict = namedtuple("Verdict", "warning action") # action: None, "schedule" or "cancel"
+
+class WarningPolicy:
+    def __init__(self, backup=BACKUP, approaching=APPROACHING, shutdown_at=SHUTDOWN, delay=DELAY):
+        self.backup = backup
+        self.approaching = approaching
+        self.shutdown_at = shutdown_at
+        self.delay = delay # minutes between "schedule" and the power off
+        self.shutdown = False # a delayed shutdown is pending
+
+    def update(self, pld_state, capacity):
+        if capacity is None: # no fuel gauge reading yet
+            return Verdict(None, None)
+        if pld_state == 1:
+            if self.shutdown:
+                self.shutdown = False
+                return Verdict("restored", "cancel")
+            return Verdict(None, None)
+        if capacity >= self.backup:
+            return Verdict("backup", None)
+        if capacity >= self.approaching:
+            return Verdict("approaching", None)
+        if capacity > self.shutdown_at:
+            return Verdict("critical", None)
+        if not self.shutdown:
+            self.shutdown = True
+            return Verdict("imminent", "schedule")
+        return Verdict("pending", None)
+
+    def command(self, action): # shell command for an action
+        return COMMANDS[action].format(python=shlex.quote(sys.executable), script=shlex.quote(SHUTDOWN_SCRIPT),
+                                       delay=shlex.quote(str(self.delay))) # paths with spaces or quotes
@@ -10,176 +10,273 @@
 # http://suptronics.com/Raspberrypi/Power_mgmt/x1203-v1.0.html
 
 import sys
-import struct
-from pathlib import Path
-from subprocess import check_output, CalledProcessError, call
-import smbus2
-from PyQt5.QtWidgets import QApplication, QLabel, QVBoxLayout, QWidget
-from PyQt5.QtCore import QTimer, Qt
-from PyQt5.QtGui import QIcon
-from gpiozero import InputDevice, Button
-
-# Constants
-CHG_ONOFF_PIN = 16 # pinctrl get 16
-PLD_BUTTON = Button(6) # down = fail, up = pass
-bus = smbus2.SMBus(1) # i2cdetect -y 1
-
-def read_voltage_and_capacity(bus):
-    address = 0x36 # i2cget -y 1 0x36 ...
-    voltage_read = bus.read_word_data(address, 2) # 0x02 w
-    capacity_read = bus.read_word_data(address, 4) # 0x04 w
-    voltage_swapped = struct.unpack("<H", struct.pack(">H", voltage_read))[0] # big endian to little endian
-    voltage = voltage_swapped * 1.25 / 1000 / 16 # convert to understandable voltage
-    capacity_swapped = struct.unpack("<H", struct.pack(">H", capacity_read))[0] # big endian to little endian
-    capacity = capacity_swapped / 256 # convert to 1-100% scale
-    return voltage, capacity
-
-def get_pld_state():
-    if PLD_BUTTON.is_pressed:
-        return 0 # power loss/adapter failure
-    else:
-        return 1 # power ok
-
-def read_hardware_metric(command_args, strip_chars): #(["command","arg1", "arg2",...],'strip_chars') ** not likely to be very useful outside of vcgencmd **
-    try:
-        output = check_output(command_args).decode("utf-8") # runs a command w/ args and captures its output converting to UTF-8 encoded string
-        metric_str = output.split("=")[1].strip().rstrip(strip_chars)
-                    # split output string into a list using "="
-                    # [1] selects the second element of the list
-                    # strip any leading/trailing whitespace
-                    # further strips specific characters (strip_chars) from result
-        return float(metric_str) # converts the cleaned-up string to float and returns it.
-    except (CalledProcessError, ValueError) as e: # command not found, command fails, ValueError could occur if converting cleaned string to float fails
-        print(f"Error reading hardware metric: {e}")
-        return None
-
-def read_cpu_volts(): 
-    return read_hardware_metric(["vcgencmd", "pmic_read_adc", "VDD_CORE_V"], 'V') # return current cpu voltage
-
-def read_cpu_amps():
-    return read_hardware_metric(["vcgencmd", "pmic_read_adc", "VDD_CORE_A"], 'A') # reurn current cpu amperage
-
-def read_cpu_temp():
-    return read_hardware_metric(["vcgencmd", "measure_temp"], "'C") # return current cpu temp
-
-def read_input_voltage():
-    return read_hardware_metric(["vcgencmd", "pmic_read_adc", "EXT5V_V"], 'V') # return input voltage
-
-def get_fan_rpm():
-    try:
-        sys_devices_path = Path('/sys/devices/platform/cooling_fan') 
-        fan_input_files = list(sys_devices_path.rglob('fan1_input')) # scan path for fan1_input (sometimes its under hwmon2, sometimes hwmon3...)
-        if not fan_input_files: # nothing found?
-            return "No fan?"
-        with open(fan_input_files[0], 'r') as file: # file found, opened
-            rpm = file.read().strip() # read value and strip anything else
-        return f"{rpm} RPM" # return "xxxx RPM"
-    except FileNotFoundError: 
-        return "Fan RPM file not found"
-    except PermissionError:
-        return "Permission denied accessing the fan RPM file"
-    except Exception as e:
-        return f"Unexpected error: {e}"
-
-def power_consumption_watts():
-    output = check_output(['vcgencmd', 'pmic_read_adc']).decode("utf-8") # gets a printout of all rpi5 voltages/amperages, converts output from binary to utf-8 string
-    lines = output.split('\n') # splits the output based on newline
-    amperages = {} # initialize amps dictionary
-    voltages = {} # initialize volts dictionary
-    for line in lines: # go through all lines one by one
-        cleaned_line = line.strip() # removes any leading or trailing whitespace from the line
-        if cleaned_line: # checks if the line is not empty after stripping
-            parts = cleaned_line.split(' ') # split into parts based on spaces
-            label, value = parts[0], parts[-1] # label = V or A, value = reading
-            val = float(value.split('=')[1][:-1]) # convert value to float
-            short_label = label[:-2] # 
-            if label.endswith('A'): # If the label ends with 'A', it's an amperage value and is added to the amperages dictionary
-                amperages[short_label] = val
-            else: # Otherwise, it's added to the voltages dictionary
-                voltages[short_label] = val
-    wattage = sum(amperages[key] * voltages[key] for key in amperages if key in voltages) # iterates over each key in amperages
-    return wattage                                                                        # and checks if the same key exists in voltages
-                                                                                          # then multiplies the keys to get system wattage
+import json
+from subprocess import call
+from PyQt5.QtWidgets import QApplication, QGridLayout, QLabel, QWidget
+from PyQt5.QtCore import QTimer, Qt, QObject, QThread, QPointF, pyqtSignal, pyqtSlot
+from PyQt5.QtGui import QColor, QIcon, QPainter, QPalette, QPen, QPolygonF, QTransform
+from PyQt5.QtNetwork import QLocalSocket
+from client import RECONNECT_DELAYS
+from x120xd import SOCKET_PATH, SOURCES, Collector, fmt
+from policy import WarningPolicy
+from journal import Journal
+import instrument
+
+SECTIONS = [ # header, then (sample field, caption, format, unit) rows
+    ("X120x Stats", [
+        ("voltage", "UPS Voltage", ".3f", "V"),
+        ("capacity", "Battery", ".3f", "%"),
+        ("charging", "Charging", None, None),
+    ]),
+    ("RPi5 Stats", [
+        ("input_voltage", "Input Voltage", ".3f", "V"),
+        ("cpu_volts", "CPU Volts", ".3f", "V"),
+        ("cpu_amps", "CPU Amps", ".3f", "A"),
+        ("watts", "System Watts", ".3f", "W"),
+        ("cpu_temp", "CPU Temp", ".1f", "\u00b0C"),
+        ("fan_rpm", "Fan RPM", "d", " RPM"),
+    ]),
+]
+
+PLOTS = [ # sample field, caption, pen colour
+    ("capacity", "Battery %", "#00FF00"),
+    ("voltage", "UPS Voltage", "#FF00FF"),
+    ("watts", "System Watts", "#FF0000"),
+]
+PLOT_BUCKETS = 256 # min/max pairs kept per plot, whatever the length of the history
+
+POWER_OK = "<FONT COLOR='#00FF00'>\U00002714 AC Power: OK! \U00002714<BR/>\U00002714 Power Adapter: OK! \U00002714</FONT>"
+POWER_LOSS = "<FONT COLOR='#FF0000'>\U000026A0 Power Loss OR Power Adapter Failure \U000026A0</FONT>"
+
+WARNINGS = {
+    "backup": "<FONT COLOR='#FF0000';FONT-SIZE: 14pt;>Running on UPS Backup Power<BR/>Batteries @{capacity:.2f}&#37;",
+    "approaching": "<FONT COLOR='#FF0000';FONT-SIZE: 14pt;>UPS Power levels approaching critical,<BR/>Batteries @{capacity:.2f}&#37;</FONT>",
+    "critical": "<FONT COLOR='#FF0000';FONT-SIZE: 16pt;>UPS Power levels critical,<BR/>Batteries @{capacity:.2f}&#37;</FONT>",
+    "imminent": "<FONT COLOR='#FF0000';FONT-SIZE: 18pt;>UPS Power failure imminent!<BR/>Auto shutdown to occur in {delay} minutes!</FONT>",
+    "pending": "<FONT COLOR='#FF0000';FONT-SIZE: 18pt;>UPS Power failure imminent!<BR/>Auto shutdown to occur within {delay} minutes!</FONT>",
+    "restored": "<FONT COLOR='#00FF00';FONT-SIZE: 18pt;>AC Power has been restored<BR/>Auto shutdown has been cancelled!</FONT>",
+}
+
+class MinMaxBuffer:
+    # bounded history for a plot: each bucket keeps the min and max of `span` samples;
+    # when all buckets are used, neighbours merge and `span` doubles, so memory and paint cost stay fixed
+    def __init__(self, size=PLOT_BUCKETS):
+        self.size = size # even, so a merge always leaves whole buckets
+        self.span = 1
+        self.count = 0 # samples in the last bucket
+        self.lows = []
+        self.highs = []
+
+    def append(self, value): # True if the plotted envelope changed
+        if self.count < self.span and self.lows:
+            self.count += 1
+            if value < self.lows[-1]:
+                self.lows[-1] = value
+            elif value > self.highs[-1]:
+                self.highs[-1] = value
+            else:
+                return False
+            return True
+        if len(self.lows) == self.size:
+            self.lows = [min(a, b) for a, b in zip(self.lows[::2], self.lows[1::2])]
+            self.highs = [max(a, b) for a, b in zip(self.highs[::2], self.highs[1::2])]
+            self.span *= 2
+        self.lows.append(value)
+        self.highs.append(value)
+        self.count = 1
+        return True
+
+class Sparkline(QWidget):
+    # min/max envelope of a MinMaxBuffer, repainted only when the envelope changes
+    # the polygon is kept in (bucket, value) coordinates and edited in place, the painter's transform scales it
+    def __init__(self, color, parent=None):
+        super().__init__(parent)
+        self.buffer = MinMaxBuffer()
+        self.polygon = QPolygonF() # low, high point for each bucket
+        self.pen = QPen(QColor(color))
+        self.pen.setCosmetic(True) # one pixel whatever the scale
+        self.background = parent.palette().color(QPalette.Window) if parent is not None else QColor("#2C132C")
+        self.setAttribute(Qt.WA_OpaquePaintEvent) # paints its own background, the parent is left alone
+        self.setMinimumHeight(36)
+
+    def append(self, value):
+        if not self.buffer.append(value):
+            return
+        lows, highs = self.buffer.lows, self.buffer.highs
+        last = len(lows) - 1
+        size = self.polygon.size()
+        if size == 2 * last + 2: # the last bucket grew
+            self.polygon.replace(2 * last, QPointF(last, lows[last]))
+            self.polygon.replace(2 * last + 1, QPointF(last, highs[last]))
+        elif size == 2 * last: # a new bucket
+            self.polygon.append(QPointF(last, lows[last]))
+            self.polygon.append(QPointF(last, highs[last]))
+        else: # buckets were merged
+            self.polygon = QPolygonF([QPointF(i, v) for i, pair in enumerate(zip(lows, highs)) for v in pair])
+        self.update() # coalesced into the next paint
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.background)
+        if not self.buffer.lows:
+            return
+        bottom, top = min(self.buffer.lows), max(self.buffer.highs)
+        scale = (self.height() - 1) / ((top - bottom) or 1.0)
+        painter.setTransform(QTransform((self.width() - 1) / (self.buffer.size - 1), 0, 0, -scale, 0, self.height() - 1 + bottom * scale))
+        painter.setPen(self.pen)
+        painter.drawPolyline(self.polygon)
+
+class SampleWorker(QObject):
+    # reads the hardware on its own thread so a stalled sensor never blocks the GUI
+    sampled = pyqtSignal(dict)
+
+    def __init__(self):
+        super().__init__()
+        self.collector = None
+
+    @pyqtSlot()
+    def collect(self):
+        if self.collector is None:
+            self.collector = Collector()
+        self.sampled.emit(self.collector.sample())
+
 class UPSStatusWindow(QWidget):
+    request_sample = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle(" X120X UPS Status ")
-        self.setStyleSheet("BACKGROUND-COLOR: #2C132C;")
-        self.resize(450, 380)
-        self.label = QLabel(self)
-        self.label.setMinimumSize(450, 380)
-        self.label.setWordWrap(True)
-        self.label.setStyleSheet("COLOR: #FFFFFF; FONT-WEIGHT: bold; FONT-SIZE: 14pt;")
-        self.label.setAlignment(Qt.AlignCenter)
-        layout = QVBoxLayout(self)
-        layout.addWidget(self.label)
-        self.setLayout(layout)
-        # Populate initial data
-        self.shutdown = False
-        self.update_status()
+        self.resize(460, 660)
+        # a palette rather than a style sheet: style sheets make every small repaint go through QStyleSheetStyle
+        palette = self.palette()
+        palette.setColor(QPalette.Window, QColor("#2C132C"))
+        palette.setColor(QPalette.WindowText, QColor("#FFFFFF"))
+        self.setPalette(palette)
+        self.setAutoFillBackground(True)
+        font = self.font()
+        font.setBold(True)
+        font.setPointSize(14)
+        self.setFont(font)
+        red = QPalette(palette)
+        red.setColor(QPalette.WindowText, QColor("#FF0000"))
+        # one widget per value, each only touched when its text changes
+        layout = QGridLayout(self)
+        self.values = {}
+        self.shown = {}
+        row = 0
+        for header, fields in SECTIONS + [("\U000026A1 Power Status \U000026A1", [])]:
+            layout.addWidget(self.rich(f"<FONT COLOR='#9C009C'>-=-=-=-=-=</FONT><FONT COLOR='#FF00FF'> {header} </FONT><FONT COLOR='#9C009C'>=-=-=-=-=-</FONT>"), row, 0, 1, 2)
+            row += 1
+            for key, caption, spec, unit in fields:
+                layout.addWidget(QLabel(f"{caption}:", self), row, 0, Qt.AlignRight)
+                value = QLabel("--", self)
+                value.setTextFormat(Qt.PlainText) # no rich text parse on every update
+                value.setPalette(red)
+                layout.addWidget(value, row, 1) # fills the cell, so new text never changes the layout
+                self.values[key] = value
+                row += 1
+        for key in ("power", "warning"):
+            self.values[key] = self.rich("")
+            self.values[key].setWordWrap(True)
+            layout.addWidget(self.values[key], row, 0, 1, 2)
+            row += 1
+        self.plots = {}
+        for key, caption, color in PLOTS:
+            layout.addWidget(QLabel(caption, self), row, 0, Qt.AlignRight)
+            self.plots[key] = Sparkline(color, self)
+            layout.addWidget(self.plots[key], row, 1)
+            row += 1
+        layout.setColumnStretch(1, 1)
+        self.policy = WarningPolicy()
+        self.journal = Journal("qtx120x.py") # silently off unless it can write the journal
+        self.update_status = instrument.wrap("render", self.update_status) # changed widgets only, painted later
+        self.last_sample = None
+        self.attempts = 0 # reconnects tried since the daemon went away
+        self.socket = QLocalSocket(self)
+        self.socket.readyRead.connect(self.read_samples)
+        self.socket.disconnected.connect(self.daemon_lost)
+        self.socket.connectToServer(SOCKET_PATH)
+        if not self.socket.waitForConnected(1000): # x120xd.py owns the hardware and pushes samples
+            self.start_worker() # no daemon running
+
+    def start_worker(self): # read the hardware ourselves on a worker thread
+        self.worker_thread = QThread(self)
+        self.worker = SampleWorker()
+        self.worker.moveToThread(self.worker_thread)
+        self.worker.sampled.connect(self.update_status) # queued back to the GUI thread
+        self.request_sample.connect(self.worker.collect) # queued to the worker thread
+        self.worker_thread.start()
+        self.request_sample.emit()
         self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_status)
+        self.timer.timeout.connect(self.request_sample)
         self.timer.start(30000)  ## milliseconds
 
-    def update_status(self):
-        voltage, capacity = read_voltage_and_capacity(bus)
-        cpu_volts = read_cpu_volts()
-        cpu_amps = read_cpu_amps()
-        cpu_temp = read_cpu_temp()
-        input_voltage = read_input_voltage()
-        fan_rpm = get_fan_rpm()
-        pwr_use = power_consumption_watts()
-        pld_state = get_pld_state()
-        warn_status = ""
-
-        if capacity >= 90: # up = disabled
-            charge_status = "<FONT COLOR='#FF0000'>disabled</FONT>"
-            InputDevice(CHG_ONOFF_PIN,pull_up=True)
-        else: # down = enabled
-            charge_status = "<FONT COLOR='#FF0000'>enabled</FONT>"
-            InputDevice(CHG_ONOFF_PIN,pull_up=False)
-
-        if pld_state == 1:
-            power_status = "<FONT COLOR='#00FF00'>\U00002714 AC Power: OK! \U00002714<BR/>\U00002714 Power Adapter: OK! \U00002714</FONT>"
-        else:
-            power_status = "<FONT COLOR='#FF0000'>\U000026A0 Power Loss OR Power Adapter Failure \U000026A0</FONT>"
-
-        if pld_state != 1 and capacity >=51:
-            warn_status = f"<FONT COLOR='#FF0000';FONT-SIZE: 14pt;>Running on UPS Backup Power<BR/>Batteries @{capacity:.2f}&#37;"
-        elif pld_state != 1 and capacity <= 50 and capacity >= 25:
-            warn_status = f"<FONT COLOR='#FF0000';FONT-SIZE: 14pt;>UPS Power levels approaching critical,<BR/>Batteries @{capacity:.2f}&#37;</FONT><BR/>"
-        elif pld_state != 1 and capacity <= 24 and capacity >= 16:
-            warn_status = f"<FONT COLOR='#FF0000';FONT-SIZE: 16pt;>UPS Power levels critical,<BR/>Batteries @{capacity:.2f}&#37;</FONT><BR/>"
-        elif pld_state != 1 and capacity <= 15 and not self.shutdown:
-            self.shutdown = True
-            warn_status = "<FONT COLOR='#FF0000';FONT-SIZE: 18pt;>UPS Power failure imminent!<BR/>Auto shutdown to occur in 5 minutes!</FONT><BR/>"
-            call("sudo shutdown -P +5 'Power failure, shutdown in 5 minutes.'", shell=True)
-        elif pld_state != 1 and self.shutdown:
-            warn_status = "<FONT COLOR='#FF0000';FONT-SIZE: 18pt;>UPS Power failure imminent!<BR/>Auto shutdown to occur within 5 minutes!</FONT><BR/>"
-        elif pld_state == 1 and self.shutdown:
-            call("sudo shutdown -c 'Shutdown is cancelled'", shell=True)
-            warn_status = "<FONT COLOR='#00FF00';FONT-SIZE: 18pt;>AC Power has been restored<BR/>Auto shutdown has been cancelled!</FONT><BR/>"
-            self.shutdown = False
-        else:
-            warn_status = ""
-
-        text = (
-            f"<FONT COLOR='#9C009C'>-=-=-=-=-=</FONT><FONT COLOR='#FF00FF'> X120x Stats </FONT><FONT COLOR='#9C009C'>=-=-=-=-=-</FONT><BR/>"
-            f"UPS Voltage: <FONT COLOR='#FF0000'>{voltage:.3f}V</FONT><BR/>"
-            f"Battery: <FONT COLOR='#FF0000'>{capacity:.3f}&#37;</FONT><BR/>"
-            f"Charging: </FONT>{charge_status}</FONT><BR/>"
-            f"<FONT COLOR='#9C009C'>-=-=-=-=-=</FONT><FONT COLOR='#FF00FF'> RPi5 Stats </FONT><FONT COLOR='#9C009C'>=-=-=-=-=-</FONT><BR/>"
-            f"Input Voltage: <FONT COLOR='#FF0000'>{input_voltage:.3f}V</FONT><BR/>"
-            f"CPU Volts: <FONT COLOR='#FF0000'>{cpu_volts:.3f}V</FONT><BR/>"
-            f"CPU Amps: <FONT COLOR='#FF0000'>{cpu_amps:.3f}A</FONT><BR/>"
-            f"System Watts: <FONT COLOR='#FF0000'>{pwr_use:.3f}W</FONT><BR/>"
-            f"CPU Temp: <FONT COLOR='#FF0000'>{cpu_temp:.1f}&deg;C</FONT><BR/>"
-            f"Fan RPM: <FONT COLOR='#FF0000'>{fan_rpm}</FONT><BR/>"
-            f"<FONT COLOR='#9C009C'>-=-=-= <FONT COLOR='#FF00FF'>\U000026A1 Power Status \U000026A1 </FONT><FONT COLOR='#9C009C'>=-=-=-</FONT><BR/>"
-            f"{power_status}<BR/>"
-            f"{warn_status}"
-        )
-        self.label.setText(text)
+    def daemon_lost(self): # x120xd.py stopped or is restarting: the last values are stale until it is back
+        if self.last_sample is not None:
+            self.update_status({**self.last_sample, "stale": sorted(set(SOURCES.values()))})
+        self.attempts = 0
+        QTimer.singleShot(int(RECONNECT_DELAYS[0] * 1000), self.reconnect)
+
+    def reconnect(self):
+        self.socket.connectToServer(SOCKET_PATH)
+        if self.socket.waitForConnected(100): # the latest sample comes on connect
+            return
+        self.socket.abort()
+        self.attempts += 1
+        if self.attempts < len(RECONNECT_DELAYS):
+            QTimer.singleShot(int(RECONNECT_DELAYS[self.attempts] * 1000), self.reconnect)
+        else: # it stayed away, so GPIO 6 and the gauge are free
+            self.start_worker()
+
+    def rich(self, text):
+        label = QLabel(text, self)
+        label.setTextFormat(Qt.RichText)
+        label.setAlignment(Qt.AlignCenter)
+        return label
+
+    def show_value(self, key, text):
+        if self.shown.get(key) != text:
+            self.shown[key] = text
+            self.values[key].setText(text)
+
+    def read_samples(self):
+        while self.socket.canReadLine():
+            self.last_sample = json.loads(bytes(self.socket.readLine()))
+            self.update_status(self.last_sample)
+
+    def closeEvent(self, event):
+        self.socket.disconnected.disconnect() # no reconnect or stale update once we are closing
+        if hasattr(self, "worker_thread"):
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+        self.journal.close()
+        super().closeEvent(event)
+
+    def update_status(self, sample):
+        capacity = sample["capacity"]
+        pld_state = sample["pld"]
+
+        for header, fields in SECTIONS:
+            for key, caption, spec, unit in fields:
+                if spec is not None:
+                    self.show_value(key, fmt(sample, key, spec, unit))
+        self.show_value("charging", "enabled" if sample["charging"] else "disabled") # charge pin is driven by the collector
+        self.show_value("power", POWER_OK if pld_state == 1 else POWER_LOSS)
+
+        verdict = self.policy.update(pld_state, capacity)
+        if verdict.action == "schedule":
+            self.journal.record("shutdown_scheduled", urgent=True, capacity=capacity, delay=self.policy.delay)
+        elif verdict.action == "cancel":
+            self.journal.record("shutdown_cancelled", capacity=capacity)
+        if verdict.action:
+            call(self.policy.command(verdict.action), shell=True)
+        self.journal.tick()
+        self.show_value("warning", WARNINGS.get(verdict.warning, "").format(capacity=capacity, delay=self.policy.delay))
+
+        stale = sample.get("stale", ())
+        for key, plot in self.plots.items():
+            if sample.get(key) is not None and SOURCES[key] not in stale:
+                plot.append(sample[key])
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -187,4 +284,9 @@ if __name__ == "__main__":
     icon = QIcon("/usr/share/icons/accumulator.png")
     window.setWindowIcon(icon)
     window.show()
+    instrument.install_signal_handler() # kill -USR1 dumps sensor/tick/render latencies
+    if instrument.enabled:
+        wake = QTimer() # Python signal handlers only run when the Qt loop hands control back
+        wake.timeout.connect(lambda: None)
+        wake.start(500)
     sys.exit(app.exec_())
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# Replays recorded or synthetic UPS traces through the real shutdown logic on a simulated clock
+# the watchdog (merged.py's AdaptiveScheduler) and the front-ends (policy.WarningPolicy) are woken exactly when
+# they would be on the Pi, so an 8 hour outage replays in milliseconds; every shutdown, schedule and cancel is
+# reported with its trace time. A sweep runs every policy against every trace, one process per core.
+# a shutdown only powers off once shutdown.py's hooks have used their budget (the worst case), and the
+# front-ends' delay is cut short like shutdown.py --delay does when the predicted runtime won't cover it
+# both see the trace through filters.BatteryFilter, the front-ends with x120xd.py's load compensation
+# the watchdog also gets the fuel gauge alerts merged.py arms: the chip latches an SOC fall through its empty
+# threshold and any reading under its minimum voltage between two samples, and reports its charge rate (CRATE)
+# usage: replay.py trace.csv|history.bin|--synthetic [policies.json]
+#   a trace CSV has the columns time,voltage,capacity,pld,watts; policies.json is a list of policies,
+#   or a dict of lists that is expanded into every combination
+
+import bisect
+import csv
+import itertools
+import json
+import math
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from estimator import runtime_series
+from filters import BatteryFilter
+from gauge import VALRT_LSB
+from policy import WarningPolicy
+from scheduler import AdaptiveScheduler
+import shutdown
+
+FRONTEND_INTERVAL = 30 # seconds between front-end samples, PLD edges wake them early like x120xd.py does
+RATE_WINDOW = 60 # seconds of SOC the emulated CRATE is measured over
+CUTOFF_VOLTAGE = 3.0 # V where the UPS drops the load
+WATCHDOG = ("confirm", "ac_loss_shutdown", "min_runtime", "critical_capacity", "critical_voltage")
+FRONTEND = ("backup", "approaching", "shutdown_at", "delay")
+DEFAULT_POLICY = { # merged.py and the front-ends as shipped
+    "confirm": 3, "ac_loss_shutdown": 120, "min_runtime": 5,
+    "backup": 51, "approaching": 25, "shutdown_at": 15, "delay": 5,
+}
+OCV = ( # open circuit voltage of a Li-ion cell against SOC, for synthetic traces
+    (0, 5, 10, 20, 40, 60, 80, 100),
+    (3.00, 3.30, 3.45, 3.60, 3.72, 3.82, 3.98, 4.20),
+)
+
+Trace = namedtuple("Trace", "name time voltage capacity pld watts")
+Action = namedtuple("Action", "time source action reason") # time in seconds from the start of the trace
+Result = namedtuple("Result", "trace actions poweroff empty wakeups") # seconds; poweroff/empty None if it never happened
+
+def load_csv(path):
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    columns = {key: np.array([float(row[key]) if row[key] != "" else np.nan for row in rows])
+               for key in ("time", "voltage", "capacity", "pld", "watts")}
+    return Trace(os.path.basename(path), **columns)
+
+def load_history(path): # the x120xd.py ring, oldest record first
+    from history import History
+    history = History(path, writable=False)
+    try:
+        records = history.tail(len(history))
+        return Trace(os.path.basename(path), *(records[key].astype(float) for key in ("time", "voltage", "capacity", "pld", "watts")))
+    finally:
+        history.close()
+
+def load(path):
+    return load_csv(path) if path.endswith(".csv") else load_history(path)
+
+def synthetic(hours=8.0, outage=600, restore=None, watts=5.0, step=1.0, noise=0.0, seed=0):
+    # AC until `outage`, then a constant `watts` load that empties the pack after `hours`;
+    # AC comes back at `restore` seconds if given, otherwise the trace ends at the cut-off
+    rng = np.random.default_rng(seed)
+    end = outage + hours * 3600 if restore is None else restore + 3600
+    t = np.arange(0.0, end + step, step)
+    on_battery = (t >= outage) & (t < (math.inf if restore is None else restore))
+    used = np.cumsum(on_battery * step) / (hours * 3600) * 100
+    capacity = 100 - used
+    if restore is not None: # recharge at 50% an hour
+        capacity = np.where(t >= restore, np.minimum(100, capacity + (t - restore) / 72), capacity)
+    capacity = np.clip(capacity, 0, 100)
+    voltage = np.interp(capacity, *OCV) - on_battery * 0.05 + rng.normal(0, noise, len(t))
+    pld = (~on_battery).astype(float)
+    load = np.where(on_battery, watts, watts * 1.1) + rng.normal(0, noise * 10, len(t))
+    return Trace(f"synthetic-{hours:g}h", t, voltage, capacity, pld, load)
+
+def prepare(trace): # plain lists for the replay loop, plus the runtime the estimator would have predicted
+    runtime = runtime_series(trace.time, trace.capacity, trace.watts)
+    runtime = [None if math.isnan(r) else r for r in runtime.tolist()]
+    edges = [float(trace.time[i]) for i in np.flatnonzero(np.diff(trace.pld)) + 1] # PLD changes
+    empty = np.flatnonzero((trace.pld != 1) & ((trace.voltage < CUTOFF_VOLTAGE) | (trace.capacity <= 0)))
+    return (trace.name, trace.time.tolist(), trace.voltage.tolist(), trace.capacity.tolist(),
+            trace.pld.astype(int).tolist(), trace.watts.tolist(), runtime, edges, float(trace.time[empty[0]]) if len(empty) else None)
+
+def _wakeups(time, edges, interval, start, stop):
+    # sample times for a loop that sleeps `interval()` seconds and is woken early by a PLD edge
+    now = start
+    while now <= stop:
+        yield now, bisect.bisect_right(time, now) - 1
+        step = interval()
+        edge = bisect.bisect_right(edges, now)
+        now = min(now + step, edges[edge]) if edge < len(edges) else now + step
+
+def gauge_alarms(voltage, capacity, empty_soc, min_voltage):
+    # running counts of the events the gauge latches, rounded to its register resolution like configure_alerts():
+    # SOC falls through the empty threshold (HD, soc_low) and readings under the minimum voltage (VL, voltage_low)
+    empty_soc = min(32, max(1, round(empty_soc)))
+    min_voltage = min(255, round(min_voltage / VALRT_LSB)) * VALRT_LSB
+    capacity = np.asarray(capacity)
+    falls = np.concatenate([[False], (capacity[:-1] >= empty_soc) & (capacity[1:] < empty_soc)])
+    return np.cumsum(falls).tolist(), np.cumsum(np.asarray(voltage) < min_voltage).tolist()
+
+def replay(prepared, policy=DEFAULT_POLICY):
+    name, time, voltage, capacity, pld, watts, runtime, edges, empty = prepared
+    policy = {**DEFAULT_POLICY, **policy}
+    start, stop = time[0], time[-1]
+    actions = []
+
+    # watchdog: samples at the scheduler's interval, shuts down at once
+    scheduler = AdaptiveScheduler(**{key: policy[key] for key in WATCHDOG if key in policy})
+    soc_low, voltage_low = gauge_alarms(voltage, capacity, scheduler.critical_capacity, scheduler.critical_voltage)
+    battery = BatteryFilter()
+    decision = None
+    last = -1 # sample index of the previous poll
+    wakeups = []
+    for now, i in _wakeups(time, edges, lambda: decision.interval, start, stop):
+        wakeups.append(now - start)
+        alerts = set()
+        if soc_low[i] > (soc_low[last] if last >= 0 else 0):
+            alerts.add("soc_low")
+        if voltage_low[i] > (voltage_low[last] if last >= 0 else 0):
+            alerts.add("voltage_low")
+        j = bisect.bisect_left(time, time[i] - RATE_WINDOW)
+        rate = (capacity[i] - capacity[j]) / (time[i] - time[j]) * 3600 if i > j else 0.0 # %/hour
+        last = i
+        v, c = battery.update(now, voltage[i], capacity[i])[:2]
+        decision = scheduler.update(now, pld[i], v, c, runtime[i] if pld[i] != 1 else None, alerts, rate)
+        if decision.shutdown:
+            hooks = shutdown.budget(runtime[i])
+            actions.append(Action(now - start, "watchdog", "shutdown", decision.reasons[0]))
+            actions.append(Action(now + hooks - start, "watchdog", "poweroff", f"{hooks:.0f} s hook budget used"))
+            stop = now + hooks
+            break
+
+    # front-ends: a sample every FRONTEND_INTERVAL, a delayed shutdown that AC can still cancel
+    warnings = WarningPolicy(**{key: policy[key] for key in FRONTEND if key in policy})
+    battery = BatteryFilter()
+    deadline = None
+    for now, i in _wakeups(time, edges, lambda: FRONTEND_INTERVAL, start, stop):
+        if deadline is not None and now >= deadline:
+            break
+        c = battery.update(now, voltage[i], capacity[i], watts[i], pld[i] != 1).capacity
+        verdict = warnings.update(pld[i], c)
+        if verdict.action == "schedule":
+            deadline = now + shutdown.delay(runtime[i], warnings.delay * 60)
+            actions.append(Action(now - start, "frontend", "schedule", f"battery at {c:.1f}%"))
+        elif verdict.action == "cancel":
+            deadline = None
+            actions.append(Action(now - start, "frontend", "cancel", "AC power restored"))
+    if deadline is not None and deadline <= stop:
+        i = bisect.bisect_right(time, deadline) - 1
+        hooks = shutdown.budget(runtime[i])
+        actions.append(Action(deadline - start, "frontend", "shutdown", "delay expired"))
+        if deadline + hooks <= stop:
+            actions.append(Action(deadline + hooks - start, "frontend", "poweroff", f"{hooks:.0f} s hook budget used"))
+
+    actions.sort()
+    poweroff = next((a.time for a in actions if a.action == "poweroff"), None)
+    return Result(name, actions, poweroff, None if empty is None else empty - start, wakeups)
+
+def score(results): # summary of one policy over a library of traces
+    unclean = sum(r.empty is not None and (r.poweroff is None or r.poweroff > r.empty) for r in results)
+    needless = sum(r.empty is None and r.poweroff is not None for r in results) # shut down, but the pack would have lasted
+    margins = [(r.empty - r.poweroff) / 60 for r in results if r.empty is not None and r.poweroff is not None and r.poweroff <= r.empty]
+    return {
+        "unclean": unclean,
+        "needless": needless,
+        "min_margin_minutes": min(margins) if margins else None,
+        "mean_margin_minutes": sum(margins) / len(margins) if margins else None,
+    }
+
+_library = None # prepared traces, sent once to each worker
+
+def _init(library):
+    global _library
+    _library = library
+
+def _run(policy):
+    results = [replay(prepared, policy) for prepared in _library]
+    return policy, score(results), results
+
+def sweep(traces, policies, processes=None): # every policy against every trace, in parallel
+    library = [prepare(trace) for trace in traces]
+    with ProcessPoolExecutor(processes, initializer=_init, initargs=(library,)) as pool:
+        return list(pool.map(_run, policies, chunksize=max(1, len(policies) // (4 * (processes or os.cpu_count() or 1)))))
+
+def grid(choices): # {"confirm": [2, 3], ...} -> every combination
+    keys = list(choices)
+    return [dict(zip(keys, values)) for values in itertools.product(*(choices[key] for key in keys))]
+
+def _clock(seconds):
+    return f"{int(seconds // 3600):02d}:{int(seconds % 3600 // 60):02d}:{seconds % 60:04.1f}"
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: replay.py trace.csv|history.bin|--synthetic [policies.json]")
+        sys.exit(1)
+    traces = [synthetic()] if sys.argv[1] == "--synthetic" else [load(path) for path in sys.argv[1].split(",")]
+    if len(sys.argv) < 3:
+        for trace in traces:
+            result = replay(prepare(trace))
+            print(f"{result.trace}: {len(trace.time)} samples over {_clock(trace.time[-1] - trace.time[0])}")
+            for action in result.actions:
+                print(f"  {_clock(action.time)} {action.source} {action.action} ({action.reason})")
+            if result.empty is not None:
+                print(f"  {_clock(result.empty)} battery empty")
+        sys.exit(0)
+    with open(sys.argv[2]) as f:
+        policies = json.load(f)
+    if isinstance(policies, dict):
+        policies = grid(policies)
+    ranked = sorted(sweep(traces, policies), key=lambda r: (r[1]["unclean"], r[1]["needless"])) # safest first
+    for policy, summary, results in ranked:
+        print(json.dumps({**summary, "policy": policy}))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# State-driven sampling for the shutdown watchdog (merged.py)
+# slow on AC with a full pack, faster on battery, fastest near critical or while the voltage falls steeply
+# a shutdown is confirmed by consecutive critical samples, so it happens after `confirm` fast samples
+# rather than after `confirm` full sleep windows
+# with the fuel gauge alerts configured at the same thresholds the chip latches any crossing between samples,
+# so the near-critical band no longer needs the fast rate: the caller samples at the "alerting" interval, waking
+# earlier only when the chip's own charge rate (CRATE) says the empty threshold is about to be crossed
+# time is passed in by the caller, so the scheduler runs unchanged on a simulated clock
+
+from collections import namedtuple
+
+INTERVALS = { # seconds between samples in each state
+    "ac_full": 300,
+    "ac": 60,
+    "battery": 10,
+    "critical": 2,
+    "alerting": 60, # on battery with the gauge alerts armed
+}
+CRITICAL_CAPACITY = 20 # %
+CRITICAL_VOLTAGE = 3.20 # V
+NEAR_CAPACITY = 10 # % above CRITICAL_CAPACITY that already counts as near critical
+NEAR_VOLTAGE = 0.15 # V above CRITICAL_VOLTAGE that already counts as near critical
+STEEP_SLOPE = -0.001 # V/s, a pack sagging faster than this is sampled at the critical rate
+FULL_CAPACITY = 90 # % where charging is disabled
+
+Decision = namedtuple("Decision", "state interval shutdown reasons")
+
+class AdaptiveScheduler:
+    def __init__(self, confirm=3, ac_loss_shutdown=None, min_runtime=None, intervals=INTERVALS,
+                 critical_capacity=CRITICAL_CAPACITY, critical_voltage=CRITICAL_VOLTAGE):
+        self.confirm = confirm # consecutive critical samples before shutting down
+        self.ac_loss_shutdown = ac_loss_shutdown # seconds on battery before shutting down anyway, None = never
+        self.min_runtime = min_runtime # predicted minutes left that count as critical, None = ignore
+        self.intervals = intervals
+        self.critical_capacity = critical_capacity
+        self.critical_voltage = critical_voltage
+        self.bad = 0
+        self.outage_start = None
+        self.last = None # (time, voltage) of the previous sample
+        self.slope = 0.0 # smoothed dV/dt
+        self.soc_low = False # the gauge's empty alert, held until AC returns
+
+    def update(self, now, ac_power_state, voltage, capacity, runtime=None, alerts=None, rate=None):
+        # alerts: gauge alerts raised since the last sample (gauge.ALERTS names), None if they aren't configured
+        # rate: the gauge's charge rate in %/hour
+        if self.last is not None and now > self.last[0]:
+            self.slope += 0.5 * ((voltage - self.last[1]) / (now - self.last[0]) - self.slope)
+        self.last = (now, voltage)
+
+        if ac_power_state == 1:
+            self.bad = 0
+            self.outage_start = None
+            self.soc_low = False
+            state = "ac_full" if capacity >= FULL_CAPACITY else "ac"
+            return Decision(state, self.intervals[state], False, [])
+
+        if self.outage_start is None:
+            self.outage_start = now
+        reasons = []
+        if alerts and "soc_low" in alerts: # raised once, at the crossing; the filtered capacity only follows later
+            self.soc_low = True
+        if capacity < self.critical_capacity or self.soc_low:
+            reasons.append("critical battery level")
+        if voltage < self.critical_voltage or alerts and "voltage_low" in alerts:
+            reasons.append("critical battery voltage")
+        if runtime is not None and self.min_runtime is not None and runtime < self.min_runtime:
+            reasons.append("critical predicted runtime")
+        self.bad = self.bad + 1 if reasons else 0 # one sample above the thresholds resets the count
+
+        if self.bad >= self.confirm:
+            return Decision("critical", self.intervals["critical"], True, reasons)
+        on_battery = now - self.outage_start
+        if self.ac_loss_shutdown is not None and on_battery >= self.ac_loss_shutdown:
+            return Decision("battery", self.intervals["battery"], True, ["AC power loss or UPS unplugged"])
+
+        if alerts is None:
+            near = (reasons
+                    or capacity < self.critical_capacity + NEAR_CAPACITY
+                    or voltage < self.critical_voltage + NEAR_VOLTAGE
+                    or self.slope < STEEP_SLOPE)
+            state = "critical" if near else "battery"
+            interval = self.intervals[state]
+        else: # the gauge watches the thresholds for us
+            state = "critical" if reasons or self.slope < STEEP_SLOPE else "battery"
+            interval = self.intervals["alerting" if state == "battery" else "critical"]
+            if state == "battery" and rate is not None and rate < 0: # wake up around the predicted crossing
+                interval = max(self.intervals["critical"], min(interval, (capacity - self.critical_capacity) / -rate * 3600))
+        if self.ac_loss_shutdown is not None: # don't sleep past the AC loss deadline
+            interval = min(interval, self.ac_loss_shutdown - on_battery)
+        return Decision(state, interval, False, reasons)
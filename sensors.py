@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# vcgencmd sensor helpers used by the X120x collector (x120xd.py)
+# only suitable for use with a Raspberry Pi 5 (vcgencmd pmic_read_adc)
+# the pmic_read_adc dump is parsed by one regex compiled from its layout, into rails in a fixed PMIC_RAILS order
+
+import re
+from subprocess import check_output, CalledProcessError, TimeoutExpired
+
+VCGENCMD_TIMEOUT = 2 # seconds before a stalled vcgencmd is killed
+PMIC_LINE = re.compile(r"^\s*(\S+) (\S+?)=(-?[0-9.]+)([AV])\s*$", re.M) # "   VDD_CORE_A current(7)=2.41321000A"
+PMIC_RAILS = ( # rails with both a current and a voltage reading; the fixed index of PmicSnapshot.power and energy.py
+    "3V7_WL_SW", "3V3_SYS", "1V8_SYS", "DDR_VDD2", "DDR_VDDQ", "1V1_SYS",
+    "0V8_SW", "VDD_CORE", "3V3_DAC", "3V3_ADC", "0V8_AON", "HDMI",
+)
+
+def read_hardware_metric(command_args, strip_chars): #(["command","arg1", "arg2",...],'strip_chars') ** not likely to be very useful outside of vcgencmd **
+    try:
+        output = check_output(command_args, timeout=VCGENCMD_TIMEOUT).decode("utf-8") # runs a command w/ args and captures its output converting to UTF-8 encoded string
+        metric_str = output.split("=")[1].strip().rstrip(strip_chars) # value after "=", minus whitespace and unit characters
+        return float(metric_str)
+    except (CalledProcessError, TimeoutExpired, ValueError) as e: # command not found, command fails, ValueError could occur if converting cleaned string to float fails
+        print(f"Error reading hardware metric: {e}")
+        return None
+
+def read_cpu_temp():
+    return read_hardware_metric(["vcgencmd", "measure_temp"], "'C") # return current cpu temp
+
+def parse_pmic_adc(output): # "   VDD_CORE_A current(7)=2.41321000A" -> {'VDD_CORE_A': 2.41321}
+    return {label: float(value) for label, _, value, _ in PMIC_LINE.findall(output)}
+
+class PmicParser:
+    # the dump's layout (labels, channels, order) only changes with the firmware, so it is learnt from the first
+    # dump and compiled into one regex for the whole text that captures just the numbers, in a fixed order;
+    # a dump that doesn't match is parsed line by line and the layout compiled again
+    def __init__(self):
+        self.pattern = None
+        self.labels = ()
+        self.pairs = () # (volts slot, amps slot) per PMIC_RAILS entry
+
+    def compile(self, output):
+        lines = PMIC_LINE.findall(output)
+        self.labels = tuple(label for label, _, _, _ in lines)
+        self.pattern = re.compile(r"\s*" + r"\s+".join(f"{re.escape(label)} {re.escape(channel)}=(-?[0-9.]+){unit}"
+                                                       for label, channel, _, unit in lines) + r"\s*")
+        slots = {label: i for i, label in enumerate(self.labels)}
+        self.pairs = tuple((slots.get(name + '_V'), slots.get(name + '_A')) for name in PMIC_RAILS)
+
+    def parse(self, output): # PmicSnapshot
+        match = self.pattern.fullmatch(output) if self.pattern is not None else None
+        if match is None:
+            self.compile(output)
+            match = self.pattern.fullmatch(output)
+            if match is None: # stray lines in the dump
+                return PmicSnapshot(parse_pmic_adc(output))
+        values = list(map(float, match.groups()))
+        power = [values[volts] * values[amps] if volts is not None and amps is not None else None for volts, amps in self.pairs]
+        return PmicSnapshot(dict(zip(self.labels, values)), power)
+
+class PmicSnapshot:
+    # every PMIC rail from a single `vcgencmd pmic_read_adc`, parsed once per refresh
+    def __init__(self, rails, power=None):
+        self.rails = rails
+        if power is None:
+            power = [rails[name + '_A'] * rails[name + '_V'] if name + '_A' in rails and name + '_V' in rails else None
+                     for name in PMIC_RAILS]
+        self.power = power # watts per rail in PMIC_RAILS order, None if the rail wasn't read
+        read = [watts for watts in self.power if watts is not None]
+        self.watts = sum(read) if read else None # None, not 0 W, when vcgencmd failed or no rail pair was parsed
+
+    def get(self, label):
+        return self.rails.get(label)
+
+    @property
+    def cpu_volts(self):
+        return self.rails.get('VDD_CORE_V') # current cpu voltage
+
+    @property
+    def cpu_amps(self):
+        return self.rails.get('VDD_CORE_A') # current cpu amperage
+
+    @property
+    def input_voltage(self):
+        return self.rails.get('EXT5V_V') # input voltage
+
+pmic_parser = PmicParser()
+
+def read_pmic_snapshot():
+    try:
+        output = check_output(['vcgencmd', 'pmic_read_adc'], timeout=VCGENCMD_TIMEOUT).decode("utf-8") # all rpi5 voltages/amperages in one call
+    except (CalledProcessError, TimeoutExpired, OSError) as e:
+        print(f"Error reading hardware metric: {e}")
+        return PmicSnapshot({})
+    return pmic_parser.parse(output)
+
+def power_consumption_watts(snapshot=None):
+    if snapshot is None:
+        snapshot = read_pmic_snapshot()
+    return snapshot.watts
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# Coordinated power off: the pre-shutdown hooks run in parallel inside a budget taken from the battery runtime
+# that is left, any hook still running at the deadline is killed, and the system is powered off while the pack
+# can still carry the OS down
+# hooks are the executables in HOOK_DIR (run-parts style: flush a database, stop containers, ...); each runs in
+# its own process group and gets the reason in X120X_SHUTDOWN_REASON and its budget in X120X_SHUTDOWN_BUDGET
+# usage: shutdown.py [--dry-run] [reason]: run the hooks now and power off
+#        shutdown.py --delay MINUTES [reason]: wait for AC up to MINUTES (less if the pack won't last), then the same
+#        shutdown.py --cancel: call off a pending --delay
+
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+HOOK_DIR = os.environ.get("X120X_HOOKS", "/etc/x120x/shutdown.d")
+LOCKFILE = "/run/x120x-shutdown.pid" # held by a pending or running shutdown
+POWEROFF = "sudo nohup shutdown -h now"
+SAFETY = 0.5 # share of the predicted runtime (lower bound) we are willing to spend before the power off
+RESERVE = 30 # seconds the OS itself needs to power off after the hooks
+MAX_BUDGET = 120 # seconds the hooks get at most
+DEFAULT_BUDGET = 60 # seconds when there is no runtime prediction
+KILL_GRACE = 3 # seconds between SIGTERM and SIGKILL for a hook that overran, inside the budget
+
+Hook = namedtuple("Hook", "name status seconds") # status: ok, failed, killed or error
+
+def predicted_runtime(): # minutes left from the x120xd.py history, None if there is no history or numpy
+    try:
+        from history import History
+        from estimator import estimate_history
+        history = History(writable=False)
+    except (ImportError, OSError, ValueError):
+        return None
+    try:
+        estimate = estimate_history(history)
+    finally:
+        history.close()
+    return estimate.low if estimate.state == "discharging" else None
+
+def window(runtime): # seconds that may still pass before the power off starts, None if unknown
+    return None if runtime is None else max(0.0, runtime * 60 * SAFETY - RESERVE)
+
+def budget(runtime): # seconds the hooks get
+    left = window(runtime)
+    return DEFAULT_BUDGET if left is None else min(MAX_BUDGET, left)
+
+def delay(runtime, maximum): # seconds a delayed shutdown may wait for AC, so the hooks still get their budget
+    left = window(runtime)
+    return maximum if left is None else max(0.0, min(maximum, left - budget(runtime)))
+
+def hooks(path=HOOK_DIR): # executables in the hook directory, in name order
+    try:
+        names = sorted(os.listdir(path))
+    except OSError:
+        return []
+    found = [os.path.join(path, name) for name in names if not name.startswith(".")]
+    return [hook for hook in found if os.path.isfile(hook) and os.access(hook, os.X_OK)]
+
+def run_hooks(commands, seconds, env=None, grace=KILL_GRACE, clock=time.monotonic):
+    # every hook at once; the ones still running `grace` seconds before the budget is up get SIGTERM, then SIGKILL
+    # at the budget itself, which is a hard limit: a budget shorter than `grace` shrinks the grace with it
+    start = clock()
+    seconds = max(0.0, seconds)
+    grace = min(grace, seconds)
+    deadline = start + seconds - grace
+    results = []
+    running = {}
+    sel = selectors.DefaultSelector()
+    for command in commands:
+        try:
+            proc = subprocess.Popen([command], env=env, stdin=subprocess.DEVNULL, start_new_session=True)
+        except OSError:
+            results.append(Hook(os.path.basename(command), "error", 0.0))
+            continue
+        fd = os.pidfd_open(proc.pid) # readable once the hook exits, no polling
+        running[fd] = (command, proc)
+        sel.register(fd, selectors.EVENT_READ)
+
+    def reap(until, status): # until None: however long it takes
+        while running and (until is None or clock() < until):
+            for key, _ in sel.select(None if until is None else until - clock()):
+                command, proc = running.pop(key.fd)
+                sel.unregister(key.fd)
+                os.close(key.fd)
+                code = proc.wait()
+                results.append(Hook(os.path.basename(command), status or ("ok" if code == 0 else "failed"), clock() - start))
+
+    def kill(signum):
+        for _, proc in running.values():
+            try:
+                os.killpg(proc.pid, signum) # the hook and anything it started
+            except ProcessLookupError:
+                pass
+
+    reap(deadline, None)
+    if running:
+        kill(signal.SIGTERM)
+        reap(deadline + grace, "killed")
+    if running:
+        kill(signal.SIGKILL)
+        reap(None, "killed")
+    sel.close()
+    return results
+
+def orchestrate(reason, runtime=None, journal=None, hook_dir=HOOK_DIR, command=POWEROFF):
+    # hooks, then the power off; command=None runs the hooks only
+    seconds = budget(runtime)
+    found = hooks(hook_dir)
+    print(f"Running {len(found)} shutdown hooks with a {seconds:.0f} s budget ({reason}).")
+    env = {**os.environ, "X120X_SHUTDOWN_REASON": reason, "X120X_SHUTDOWN_BUDGET": str(int(seconds))}
+    results = run_hooks(found, seconds, env)
+    for hook in results:
+        print(f"  {hook.name}: {hook.status} after {hook.seconds:.1f} s")
+    if journal is not None:
+        journal.record("shutdown_hooks", urgent=True, reason=reason, runtime=runtime, budget=seconds,
+                       hooks={hook.name: [hook.status, round(hook.seconds, 2)] for hook in results})
+    if command is not None:
+        subprocess.call(command, shell=True)
+    return results
+
+def acquire_lock(path=LOCKFILE): # fd holding the lock, None if a shutdown is already pending
+    import fcntl
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    os.ftruncate(fd, 0)
+    os.write(fd, f"{os.getpid()}\n".encode())
+    return fd
+
+def cancel(path=LOCKFILE): # True if a pending shutdown was called off
+    fd = acquire_lock(path)
+    if fd is not None: # nothing is holding it
+        os.close(fd)
+        return False
+    with open(path) as f:
+        pid = int(f.read().split()[0])
+    os.kill(pid, signal.SIGTERM) # ignored once the hooks have started
+    return True
+
+def main(argv):
+    if argv[:1] == ["--cancel"]:
+        print("Shutdown is cancelled" if cancel() else "No shutdown pending")
+        return 0
+    wait, command = 0.0, POWEROFF
+    if argv[:1] == ["--delay"]:
+        wait, argv = float(argv[1]) * 60, argv[2:]
+    elif argv[:1] == ["--dry-run"]:
+        command, argv = None, argv[1:]
+    reason = " ".join(argv) or "Power failure"
+    lock = acquire_lock()
+    if lock is None:
+        print("Shutdown already pending")
+        return 1
+    from journal import Journal
+    journal = Journal("shutdown.py")
+    try:
+        if wait:
+            wait = delay(predicted_runtime(), wait)
+            print(f"{reason}, shutdown in {wait / 60:.1f} minutes.")
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0)) # shutdown.py --cancel
+            time.sleep(wait)
+        signal.signal(signal.SIGTERM, lambda signum, frame: None) # too late to cancel once services are going down (not SIG_IGN, the hooks would inherit it)
+        orchestrate(reason, predicted_runtime(), journal, command=command)
+    finally:
+        journal.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
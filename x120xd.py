@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# X120x UPS daemon: the only process that touches the I2C bus and the PLD/charge GPIOs
+# publishes every sample to local clients over a Unix socket, one JSON object per line
+# the latest sample is sent on connect, a new one every INTERVAL seconds and on every PLD edge
+# a client that writes "sample" gets a fresh one published at once (merged.py sampling on its own schedule),
+# a client that writes "stats" gets the instrumentation report back as {"stats": {...}}
+# the fuel gauge alerts are armed at the watchdog's thresholds, so every sample carries the alerts the chip
+# latched since the previous one and its charge rate
+# usage: x120xd.py [interval] | x120xd.py stats
+# only suitable for use with a Raspberry Pi 5 and the X1200/X1201/X1202/X1203 UPS HATs
+
+import json
+import os
+import selectors
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from client import SOCKET_PATH, connect, reconnect, subscribe, query_stats
+from sensors import PmicSnapshot, read_pmic_snapshot
+from filters import BatteryFilter
+from hwmon import SysfsMetrics
+from history import History
+from journal import Journal
+from energy import EnergyMeter
+import instrument
+
+INTERVAL = 30 # seconds between samples
+SENSOR_TIMEOUT = 2 # seconds a sample waits for the slowest sensor
+SOURCES = { # sample field -> sensor that produced it, for the stale markers
+    "voltage": "gauge", "capacity": "gauge",
+    "input_voltage": "pmic", "cpu_volts": "pmic", "cpu_amps": "pmic", "watts": "pmic",
+    "cpu_temp": "cpu_temp", "fan_rpm": "fan_rpm",
+}
+
+def fmt(sample, key, spec="", unit=""): # a field for the front-ends: "--" without a reading, marked if stale
+    value = sample.get(key)
+    text = "--" if value is None else f"{value:{spec}}{unit}"
+    if SOURCES.get(key) in sample.get("stale", ()):
+        text += " (stale)" # sensor missed its deadline, last good value shown
+    return text
+
+class Collector:
+    # owns the hardware; hardware modules are imported here so clients don't need them
+    def __init__(self):
+        import smbus2
+        from gauge import FuelGauge
+        from pld import request_pld_line, PldEdgeSource, PldWatcher
+        from charge import request_charge_line, ChargeController
+        from scheduler import CRITICAL_CAPACITY, CRITICAL_VOLTAGE
+        self.bus = smbus2.SMBus(1) # i2cdetect -y 1
+        self.gauge = FuelGauge(self.bus)
+        self.gauge.configure_alerts(CRITICAL_CAPACITY, CRITICAL_VOLTAGE) # same thresholds as merged.py's scheduler
+        self.pld_line = request_pld_line() # edge events on GPIO 6
+        self.watcher = PldWatcher(PldEdgeSource(self.pld_line))
+        self.charger = ChargeController(request_charge_line()) # GPIO 16 held open, written only on transitions
+        self.sysfs = SysfsMetrics() # fan and thermal nodes stay open
+        self.filter = BatteryFilter() # clients see filtered voltage and capacity, raw_* are the gauge readings
+        self.sensors = {
+            "gauge": instrument.wrap("gauge", self.gauge.poll),
+            "pmic": instrument.wrap("pmic", read_pmic_snapshot, failed=lambda pmic: not pmic.rails),
+            "cpu_temp": instrument.wrap("cpu_temp", self.sysfs.cpu_temp, failed=lambda temp: temp is None),
+            "fan_rpm": instrument.wrap("fan_rpm", self.sysfs.fan_rpm, failed=lambda rpm: rpm is None),
+        }
+        self.sample = instrument.wrap("tick", self.sample)
+        self.pool = ThreadPoolExecutor(max_workers=len(self.sensors), thread_name_prefix="x120x-sensor")
+        self.pending = {} # sensor -> future still running from an earlier sample
+        self.last = {"gauge": (None, None, None, set()), "pmic": PmicSnapshot({})}
+
+    def read_sensors(self, timeout=SENSOR_TIMEOUT): # all sensors concurrently; a slow one keeps its last value and is reported stale
+        for name, read in self.sensors.items():
+            if name not in self.pending: # don't pile up reads behind one that is stuck
+                self.pending[name] = self.pool.submit(read)
+        deadline = time.monotonic() + timeout
+        stale = []
+        for name in self.sensors:
+            future = self.pending[name]
+            try:
+                self.last[name] = future.result(max(0, deadline - time.monotonic()))
+            except Exception: # timed out or failed
+                stale.append(name)
+                if not future.done():
+                    instrument.error(name) # missed the deadline, still running
+                    continue
+            del self.pending[name]
+        return stale
+
+    def sample(self):
+        stale = self.read_sensors()
+        voltage, capacity, rate, alerts = self.last["gauge"]
+        pmic = self.last["pmic"]
+        pld = self.watcher.source.get_value() # 1 = AC ok, 0 = power loss
+        fresh = "gauge" not in stale
+        alerts = sorted(alerts) if fresh else [] # a stale reading's alerts went out with the sample it came in
+        reading = self.filter.update(time.monotonic(), voltage if fresh else None, capacity if fresh else None,
+                                     None if "pmic" in stale else pmic.watts, pld == 0)
+        charging = self.charger.update(reading.capacity if fresh else None)
+        return {
+            "time": time.time(),
+            "voltage": reading.voltage,
+            "capacity": reading.capacity,
+            "raw_voltage": voltage,
+            "raw_capacity": capacity,
+            "charge_rate": rate, # %/hour, from the gauge
+            "alerts": alerts, # gauge.ALERTS names
+            "pld": pld,
+            "charging": charging,
+            "input_voltage": pmic.input_voltage,
+            "cpu_volts": pmic.cpu_volts,
+            "cpu_amps": pmic.cpu_amps,
+            "watts": pmic.watts,
+            "rails": pmic.rails, # every PMIC rail, for the exporter
+            "rail_watts": pmic.power, # indexed like sensors.PMIC_RAILS
+            "cpu_temp": self.last.get("cpu_temp"),
+            "fan_rpm": self.last.get("fan_rpm"),
+            "stale": stale,
+        }
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        self.sysfs.close()
+        self.charger.close()
+        self.pld_line.release()
+        self.bus.close()
+
+class Publisher:
+    def __init__(self, path=None):
+        path = path or SOCKET_PATH
+        if os.path.exists(path): # stale socket from a previous run
+            os.unlink(path)
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        os.chmod(path, 0o666) # readable by unprivileged front-ends
+        self.sock.listen(128)
+        self.sock.setblocking(False)
+        self.sel = selectors.DefaultSelector()
+        self.sel.register(self.sock, selectors.EVENT_READ, "accept")
+        self.clients = set()
+        self.latest = b""
+
+    def accept(self):
+        conn, _ = self.sock.accept()
+        conn.setblocking(False)
+        self.clients.add(conn)
+        self.sel.register(conn, selectors.EVENT_READ, "client")
+        if self.latest:
+            self.send(conn, self.latest)
+
+    def publish(self, sample):
+        self.latest = (json.dumps(sample, separators=(",", ":")) + "\n").encode() # encoded once for every client
+        for conn in list(self.clients):
+            self.send(conn, self.latest)
+
+    def send(self, conn, data):
+        try:
+            if conn.send(data) == len(data):
+                return
+        except OSError: # gone, or its buffer is full
+            pass
+        self.drop(conn) # never let one slow client block the collector
+
+    def drop(self, conn):
+        self.clients.discard(conn)
+        self.sel.unregister(conn)
+        conn.close()
+
+    def close(self):
+        for conn in list(self.clients):
+            self.drop(conn)
+        self.sel.close()
+        self.sock.close()
+        os.unlink(self.path)
+
+def journal_changes(journal, last, sample): # transitions between consecutive samples
+    readings = {"capacity": sample["capacity"], "voltage": sample["voltage"]}
+    if last is None:
+        journal.record("started", pld=sample["pld"], **readings)
+    elif sample["pld"] != last["pld"]:
+        if sample["pld"] == 1:
+            journal.record("power_restored", **readings)
+        else:
+            journal.record("power_lost", urgent=True, **readings) # on disk before the pack runs out
+    if last is not None and sample["charging"] != last["charging"]:
+        journal.record("charging_enabled" if sample["charging"] else "charging_disabled", **readings)
+    before = set(last["stale"]) if last is not None else set()
+    for sensor in sorted(set(sample["stale"]) - before):
+        journal.record("sensor_stale", sensor=sensor)
+    for sensor in sorted(before - set(sample["stale"])):
+        journal.record("sensor_recovered", sensor=sensor)
+
+def serve(collector, publisher, interval=INTERVAL, history=None, journal=None, energy=None, stop=None):
+    # stop: a threading.Event that ends the loop, for the benchmarks; the daemon runs until it is killed
+    sel = publisher.sel
+    sel.register(collector.watcher.source.fileno(), selectors.EVENT_READ, "pld")
+    next_tick = 0
+    last = None
+    while stop is None or not stop.is_set():
+        if time.monotonic() >= next_tick:
+            sample = collector.sample()
+            if history is not None:
+                history.append(sample) # mmap ring, no fsync
+            if journal is not None:
+                journal_changes(journal, last, sample)
+                journal.tick()
+            if energy is not None:
+                energy.append(sample) # trapezoid since the previous sample
+                sample["energy"] = energy.report()
+            last = sample
+            publisher.publish(sample)
+            next_tick = time.monotonic() + interval
+        timeout = max(0, next_tick - time.monotonic())
+        for key, _ in sel.select(timeout if stop is None else min(timeout, 0.1)): # notice `stop` soon enough
+            if key.data == "accept":
+                publisher.accept()
+            elif key.data == "pld":
+                collector.watcher.wait(0) # consume the edge
+                next_tick = 0 # change notification: publish right away
+            else: # clients only ever send EOF, a sample request or a stats query
+                conn = key.fileobj
+                try:
+                    data = conn.recv(64)
+                except OSError:
+                    data = b""
+                if b"sample" in data:
+                    next_tick = 0 # every client gets it, like a timed sample
+                if data.startswith(b"stats") and conn in publisher.clients:
+                    publisher.send(conn, (json.dumps({"stats": instrument.report()}) + "\n").encode())
+                elif not data and conn in publisher.clients:
+                    publisher.drop(conn)
+
+def samples(interval=INTERVAL): # from the daemon while it runs, otherwise straight from the hardware
+    sock = connect()
+    while sock is not None: # resubscribe if the daemon restarts, read the hardware if it stays away
+        try:
+            yield from subscribe(sock)
+        except (OSError, ValueError) as e: # reset, or a line torn as the daemon went down
+            print(f"Error reading samples: {e}")
+        sock = reconnect()
+    collector = Collector()
+    try:
+        while True:
+            yield collector.sample()
+            collector.watcher.wait(interval) # refresh early on a PLD edge
+    finally:
+        collector.close()
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["stats"]:
+        stats = query_stats()
+        print("x120xd.py is not running" if stats is None else instrument.format_report(stats))
+        sys.exit(0)
+    interval = float(sys.argv[1]) if len(sys.argv) > 1 else INTERVAL
+    instrument.install_signal_handler()
+    collector = Collector()
+    publisher = Publisher()
+    history = History()
+    journal = Journal("x120xd")
+    energy = EnergyMeter(sample_interval=interval)
+    try:
+        serve(collector, publisher, interval, history, journal, energy)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        energy.close()
+        journal.close()
+        history.close()
+        publisher.close()
+        collector.close()